@@ -0,0 +1,145 @@
+"""Segment a library of PDFs into per-document vocabulary, without the GUI.
+
+    python batch.py BOOKS_DIR [--dictionary JMdict.xml] [--workers N] [--output vocab.jsonl]
+
+Every document becomes one JSON line with its word counts and dictionary
+entries, written as soon as all of its pages are done.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+
+import fitz
+
+from dictionary import JMDict
+from segmentation import tokenize
+
+# Pages handed to a worker at a time; big books are spread over several workers
+PAGES_PER_TASK = 16
+
+# The dictionary of this worker process, loaded once by init_worker
+_dictionary = None
+
+
+def init_worker(xml_file):
+    """Open the compiled dictionary once for the life of a worker."""
+    global _dictionary
+    _dictionary = JMDict(xml_file)
+    _dictionary.get_trie()
+
+
+def entry_json(entry):
+    return {'id': entry.id, 'word': entry.word, 'reading': entry.reading, 'meaning': list(entry.meaning)}
+
+
+def process_pages(task):
+    """Segment a range of a document's pages, returning their word counts and dictionary entries."""
+    path, start, end = task
+    counts = Counter()
+    entries = {}
+    try:
+        doc = fitz.open(path)
+        try:
+            for page_number in range(start, end):
+                counts.update(tokenize(_dictionary, doc.load_page(page_number).get_text("text")))
+        finally:
+            doc.close()
+    except Exception as e:
+        return path, counts, entries, f"{type(e).__name__}: {e}"
+
+    for word in counts:
+        entries[word] = [entry_json(entry) for _, _, found in _dictionary.lookup(word) for entry in found]
+    return path, counts, entries, None
+
+
+def find_pdfs(directory):
+    """Walk a directory for PDF files, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                yield os.path.join(root, name)
+
+
+class Batch:
+    """Splits the documents into page ranges and puts their results back together per document."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.documents = {}  # Documents with page ranges still being worked on
+        self.pages = 0
+
+    def tasks(self):
+        """Yield (path, first page, end page) tasks, registering each document before its first task."""
+        for path in self.paths:
+            try:
+                with fitz.open(path) as doc:
+                    page_count = len(doc)
+            except Exception:
+                # Let a worker run into the error so it's reported with the document
+                page_count = 0
+            ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+                      for start in range(0, page_count, PAGES_PER_TASK)] or [(0, 0)]
+            self.documents[path] = {'path': path, 'pages': page_count, 'tasks_left': len(ranges),
+                                    'counts': Counter(), 'entries': {}, 'error': None}
+            for start, end in ranges:
+                yield path, start, end
+
+    def add_result(self, path, counts, entries, error):
+        """Merge a finished page range, returning the document's record once all its ranges are in."""
+        document = self.documents[path]
+        document['counts'].update(counts)
+        document['entries'].update(entries)
+        document['error'] = document['error'] or error
+        document['tasks_left'] -= 1
+        if document['tasks_left']:
+            return None
+
+        del self.documents[path]
+        self.pages += document['pages']
+        record = {'path': path, 'pages': document['pages'], 'tokens': sum(document['counts'].values())}
+        if document['error']:
+            record['error'] = document['error']
+        record['vocabulary'] = [{'word': word, 'count': count, 'entries': document['entries'].get(word, [])}
+                                for word, count in document['counts'].most_common()]
+        return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment every PDF in a directory into vocabulary with dictionary entries, as JSONL.")
+    parser.add_argument('directory', help="directory to search for PDFs")
+    parser.add_argument('--dictionary', default='./JMdict.xml', help="JMdict XML file (default: ./JMdict.xml)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: one per CPU)")
+    parser.add_argument('--output', help="file to write to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # Compile the index here so the workers don't all try to at once
+    JMDict(args.dictionary)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    batch = Batch(find_pdfs(args.directory))
+    started = time.perf_counter()
+    documents = 0
+    try:
+        with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args.dictionary,)) as pool:
+            for result in pool.imap_unordered(process_pages, batch.tasks()):
+                record = batch.add_result(*result)
+                if record is not None:
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    output.flush()
+                    documents += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{documents} documents, {batch.pages} pages in {elapsed:.1f}s "
+          f"({batch.pages / elapsed * 60 if elapsed else 0:.0f} pages/min)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""Time the paths the reader depends on, against synthetic fixtures, and catch regressions.
+
+    python benchmark.py [--entries N] [--pages N] [--baseline FILE] [--update]
+
+Every benchmark runs in a fresh process, so the peak memory it reports is its
+own. Results are compared with the baseline file if there is one; --update
+writes them to it instead.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Rendering is benchmarked without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+# Slowdown (or memory growth) over the baseline that counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Where results are compared with, kept with the reader's other files rather than in the working directory
+DEFAULT_BASELINE = os.path.join(os.path.expanduser('~'), '.jpdf', 'benchmark.json')
+
+# Parts of speech used by the synthetic dictionary, with their JMdict descriptions
+POS_ENTITIES = {
+    'n': "noun (common) (futsuumeishi)",
+    'v1': "Ichidan verb",
+    'v5k': "Godan verb with 'ku' ending",
+    'v5m': "Godan verb with 'mu' ending",
+    'v5u': "Godan verb with 'u' ending",
+    'vk': "Kuru verb - special class",
+    'vs': "noun or participle which takes the aux. verb suru",
+    'vs-i': "suru verb - included",
+    'adj-i': "adjective (keiyoushi)",
+}
+
+# Real words, so the synthetic text has something to segment and deinflect: (kanji, reading, pos, gloss)
+CORE_WORDS = [
+    ('日本', 'にほん', 'n', "Japan"),
+    ('日本語', 'にほんご', 'n', "Japanese (language)"),
+    ('本', 'ほん', 'n', "book"),
+    ('学生', 'がくせい', 'n', "student"),
+    ('勉強', 'べんきょう', 'n vs', "study"),
+    ('食べる', 'たべる', 'v1', "to eat"),
+    ('見る', 'みる', 'v1', "to see"),
+    ('書く', 'かく', 'v5k', "to write"),
+    ('読む', 'よむ', 'v5m', "to read"),
+    ('買う', 'かう', 'v5u', "to buy"),
+    ('来る', 'くる', 'vk', "to come"),
+    ('高い', 'たかい', 'adj-i', "high; expensive"),
+    ('新しい', 'あたらしい', 'adj-i', "new"),
+    (None, 'する', 'vs-i', "to do"),
+    (None, 'これ', 'n', "this"),
+]
+
+SENTENCES = [
+    "日本語を勉強します。", "これは新しい本です。", "学生は本を読みました。",
+    "高くなかった本を買った。", "食べられない。", "手紙を書いています。",
+    "明日また来ます。", "映画を見たかった。", "日本で勉強した学生。",
+]
+
+KANJI = [chr(c) for c in range(0x4E00, 0x4E00 + 2000)]
+KANA = [chr(c) for c in range(0x3041, 0x3094)]
+
+
+# Fixtures
+
+def make_jmdict(path, entries, seed=0):
+    """Write a JMdict-shaped XML file with the core words and random filler entries."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE JMdict [\n')
+        for name, description in POS_ENTITIES.items():
+            f.write(f'<!ENTITY {name} "{description}">\n')
+        f.write(']>\n<JMdict>\n')
+
+        for seq in range(1, entries + 1):
+            if seq <= len(CORE_WORDS):
+                kanji, reading, pos, gloss = CORE_WORDS[seq - 1]
+                priority = 'ichi1'
+            else:
+                kanji = ''.join(rng.choices(KANJI, k=rng.randint(1, 3)))
+                reading = ''.join(rng.choices(KANA, k=rng.randint(2, 5)))
+                pos = rng.choice(list(POS_ENTITIES))
+                gloss = f"filler word {seq}"
+                priority = rng.choice(['ichi1', 'news2', f'nf{rng.randint(1, 48):02d}', None])
+
+            f.write(f'<entry><ent_seq>{seq}</ent_seq>')
+            pri = f'<ke_pri>{priority}</ke_pri>' if priority else ''
+            if kanji:
+                f.write(f'<k_ele><keb>{kanji}</keb>{pri}</k_ele>')
+            f.write(f'<r_ele><reb>{reading}</reb></r_ele><sense>')
+            for tag in pos.split():
+                f.write(f'<pos>&{tag};</pos>')
+            f.write(f'<gloss>{gloss}</gloss></sense></entry>\n')
+        f.write('</JMdict>\n')
+
+
+def make_pdf(path, pages, seed=0):
+    """Write a PDF of Japanese text with an image on every page."""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=595, height=842)
+        image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 150), False)
+        image.set_rect(image.irect, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        page.insert_image(fitz.Rect(340, 60, 540, 210), pixmap=image)
+        y = 80
+        while y < 800:
+            line = ''.join(rng.choice(SENTENCES) for _ in range(2))
+            page.insert_text((50, y), line, fontname='japan', fontsize=12)
+            y += 20
+    doc.save(path)
+    doc.close()
+
+
+def make_fixtures(directory, entries, pages):
+    make_jmdict(os.path.join(directory, 'JMdict.xml'), entries)
+    make_pdf(os.path.join(directory, 'book.pdf'), pages)
+
+
+# Benchmarks, each run in a fresh process with the fixture directory as its working directory
+
+def timed(function, repeat):
+    """Run a function repeatedly and get the median time of one run, in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def bench_load_entries_cold():
+    from dictionary import JMDict
+
+    def load():
+        for suffix in ('', '.tmp'):
+            if os.path.exists('JMdict.sqlite' + suffix):
+                os.remove('JMdict.sqlite' + suffix)
+        JMDict('JMdict.xml', load=False).load_entries()
+    return timed(load, 3)
+
+
+def bench_load_entries_warm():
+    from dictionary import JMDict
+    JMDict('JMdict.xml')
+    return timed(lambda: JMDict('JMdict.xml', load=False).load_entries(), 10)
+
+
+def bench_search_word():
+    from dictionary import JMDict
+    dictionary = JMDict('JMdict.xml')
+    words = [kanji or reading for kanji, reading, _, _ in CORE_WORDS] + ['存在しない']
+    return timed(lambda: [dictionary.search_word(word) for word in words], 20) / len(words)
+
+
+def bench_split_into_possible_words():
+    from dictionary import JMDict
+    from segmentation import split_into_possible_words
+    dictionary = JMDict('JMdict.xml')
+    dictionary.get_trie()
+    return timed(lambda: [split_into_possible_words(dictionary, sentence) for sentence in SENTENCES], 20) / len(SENTENCES)
+
+
+def open_reader():
+    """Start the reader on the fixture book without a window system."""
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    from pdf_reader import PDFReader
+    # Only the page on screen is timed, not its neighbours rendering in the background
+    PDFReader.prefetch_neighbours = lambda self, page_number: None
+    reader = PDFReader(os.path.abspath('book.pdf'))
+    while reader.search_index is None:
+        app.processEvents()
+    # Nothing else should be competing for the GIL while timing
+    reader.search_index.stop()
+    reader.search_index.ready.wait()
+    reader.dictionary.ready.wait()
+    app.processEvents()
+    return app, reader
+
+
+def bench_show_page(scale_mod):
+    app, reader = open_reader()
+    reader.scale_mod = scale_mod
+    pages = range(min(10, len(reader.doc)))
+
+    def show_pages():
+        # Rendered from scratch every time, like a page never seen before
+        reader.page_cache.clear()
+        reader.display_lists.invalidate(reader.doc)
+        for page_number in pages:
+            reader.show_page(page_number)
+    seconds = timed(show_pages, 3) / len(pages)
+    reader.close()
+    return seconds
+
+
+def bench_get_selected_text(cold):
+    from PyQt5.QtCore import QRect
+    app, reader = open_reader()
+    label = reader.pdf_label
+    label.selection_rect = QRect(int(40 * label.scale), int(60 * label.scale), int(300 * label.scale), int(200 * label.scale))
+    reader.active_label = label
+
+    def select():
+        if cold:
+            reader.text_layouts.clear()
+        reader.get_selected_text()
+    seconds = timed(select, 50)
+    reader.close()
+    return seconds
+
+
+BENCHMARKS = {
+    'load_entries_cold': bench_load_entries_cold,
+    'load_entries_warm': bench_load_entries_warm,
+    'search_word': bench_search_word,
+    'split_into_possible_words': bench_split_into_possible_words,
+    'show_page_x1': lambda: bench_show_page(1),
+    'show_page_x2': lambda: bench_show_page(2),
+    'get_selected_text_cold': lambda: bench_get_selected_text(True),
+    'get_selected_text': lambda: bench_get_selected_text(False),
+}
+
+
+def run_benchmark(name, directory):
+    """Run one benchmark, returning its time and the peak memory of the process."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(directory)
+    # Keep the run to the fixtures: the notes store goes under HOME, and no dictionary
+    # server that happens to be running should answer instead of the local index
+    os.environ['HOME'] = directory
+    os.environ['JPDF_DICTIONARY_SOCKET'] = os.path.join(directory, 'dictionary.sock')
+    seconds = BENCHMARKS[name]()
+    return {'seconds': seconds, 'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run_all(names, directory):
+    results = {}
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results[name] = executor.submit(run_benchmark, name, directory).result()
+        print(f"{name:30} {results[name]['seconds'] * 1000:10.3f} ms {results[name]['peak_rss_kb'] / 1024:8.1f} MB",
+              file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Get a description of every result that is worse than its baseline by more than the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_rss_kb'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {before[metric]:.6g} -> {result[metric]:.6g} "
+                                   f"(+{(result[metric] / before[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the reader on synthetic fixtures and compare with a baseline.")
+    parser.add_argument('--entries', type=int, default=20000, help="entries in the synthetic dictionary")
+    parser.add_argument('--pages', type=int, default=50, help="pages in the synthetic PDF")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f"baseline file (default: {DEFAULT_BASELINE})")
+    parser.add_argument('--update', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, as a fraction")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="run only these benchmarks")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='jpdf-benchmark-')
+    try:
+        make_fixtures(directory, args.entries, args.pages)
+        results = run_all(args.only or list(BENCHMARKS), directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    config = {'entries': args.entries, 'pages': args.pages}
+    if args.update or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print(f"Warning: baseline was recorded with {baseline.get('config')}, not {config}", file=sys.stderr)
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+from bisect import bisect_left, bisect_right
+
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtCore import Qt
+
+from pdf_label import PDFLabel
+from perf import timed
+from tiles import needs_tiles
+
+# Space between pages, in pixels
+PAGE_GAP = 10
+# Pages this far outside the viewport are rendered too, so they are ready when scrolled in
+VIEWPORT_MARGIN = 400
+
+
+class ContinuousView(QWidget):
+    """Shows the whole document as one vertical column of pages.
+
+    Every page gets placeholder geometry from its rect, but page widgets are
+    only created for the pages near the viewport and handed back to a pool
+    (with their pixmaps dropped) once they scroll away, so memory depends on
+    what is visible rather than on the length of the document.
+    """
+
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window  # Reference to PDFReader
+        self.page_tops = []
+        self.page_sizes = []
+        self.labels = {}
+        self.spare_labels = []
+
+        scroll_bar = self.main_window.scroll_area.verticalScrollBar()
+        scroll_bar.valueChanged.connect(self.update_visible_pages)
+
+    @timed('layout')
+    def relayout(self):
+        """Recompute the placeholder geometry of every page at the current scale."""
+        reader = self.main_window
+        self.page_tops = []
+        self.page_sizes = []
+        y = PAGE_GAP
+        width = 0
+        for page_number, rect in enumerate(reader.page_rects):
+            scale = reader.page_scale(page_number)
+            size = (int(rect.width * scale), int(rect.height * scale))
+            self.page_tops.append(y)
+            self.page_sizes.append(size)
+            y += size[1] + PAGE_GAP
+            width = max(width, size[0])
+
+        # Every label has to be placed again at the new scale
+        for page_number in list(self.labels):
+            self.release_label(page_number)
+
+        self.setMinimumSize(width, y)
+        self.resize(max(width, reader.scroll_area.viewport().width()), y)
+        self.update_visible_pages()
+
+    def page_geometry(self, page_number):
+        """Get the (x, y, width, height) of a page's placeholder."""
+        width, height = self.page_sizes[page_number]
+        return (self.width() - width) // 2, self.page_tops[page_number], width, height
+
+    def page_at(self, y):
+        """Get the page under a y coordinate of the view."""
+        return max(0, bisect_right(self.page_tops, y) - 1)
+
+    def visible_pages(self, margin=0):
+        """Get the range of pages intersecting the viewport, widened by a margin."""
+        if not self.page_tops:
+            return range(0)
+        scroll_area = self.main_window.scroll_area
+        top = scroll_area.verticalScrollBar().value() - margin
+        bottom = top + scroll_area.viewport().height() + 2 * margin
+        return range(self.page_at(top), min(len(self.page_tops), bisect_left(self.page_tops, bottom)))
+
+    def current_page(self):
+        """Get the page at the top third of the viewport, which is the one being read."""
+        scroll_area = self.main_window.scroll_area
+        return self.page_at(scroll_area.verticalScrollBar().value() + scroll_area.viewport().height() // 3)
+
+    def scroll_to_page(self, page_number):
+        """Scroll so the page starts at the top of the viewport."""
+        self.main_window.scroll_area.verticalScrollBar().setValue(self.page_tops[page_number] - PAGE_GAP)
+        self.update_visible_pages()
+
+    def update_visible_pages(self):
+        """Create widgets for the pages near the viewport and release the rest."""
+        reader = self.main_window
+        if not reader.continuous or reader.doc is None or not self.page_tops:
+            return
+
+        pages = self.visible_pages(VIEWPORT_MARGIN)
+        for page_number in list(self.labels):
+            if page_number not in pages:
+                self.release_label(page_number)
+
+        on_screen = self.visible_pages()
+        keys = []
+        margin_keys = []
+        for page_number in pages:
+            label = self.labels.get(page_number)
+            if label is None:
+                label = self.spare_labels.pop() if self.spare_labels else PDFLabel(reader, self)
+                self.labels[page_number] = label
+                label.page_number = page_number
+                label.setGeometry(*self.page_geometry(page_number))
+                label.show()
+
+            scale = reader.page_scale(page_number)
+            key = reader.page_key(page_number, scale)
+            if label.key == key:
+                continue
+            if (key in reader.page_cache or page_number in reader.unsaved_pages
+                    or needs_tiles(reader.page_rects[page_number], key[2])):
+                # Already rendered, only renderable here because of unsaved highlights, or drawn in tiles
+                reader.show_on_label(label, page_number, scale)
+                label.move(*self.page_geometry(page_number)[:2])
+            elif page_number in on_screen:
+                keys.append(key)
+            else:
+                margin_keys.append(key)
+
+        # Pages on screen are rendered first, the margin after; anything else queued is cancelled
+        reader.prefetcher.prefetch(keys + margin_keys)
+        reader.current_page = self.current_page()
+
+    def release_label(self, page_number):
+        """Hide a page's widget, drop its pixmap and keep it for reuse."""
+        label = self.labels.pop(page_number)
+        if label.tiled:
+            self.main_window.prefetcher.cancel(('tiles', page_number))
+        label.release()
+        label.hide()
+        self.spare_labels.append(label)
+
+    def page_rendered(self, key, pixmap):
+        """Show a page rendered in the background if its widget is still waiting for it.
+
+        The render is passed in rather than read back, the cache may not have kept it.
+        """
+        label = self.labels.get(key[1])
+        if label is not None and label.key != key:
+            label.show_render(key[1], key, pixmap)
+            label.move(*self.page_geometry(key[1])[:2])
+
+    def refresh_page(self, page_number):
+        """Re-render a page whose contents changed."""
+        label = self.labels.get(page_number)
+        if label is not None:
+            label.key = None
+        self.update_visible_pages()
+
+    def resizeEvent(self, event):
+        """Keep the pages centred when the view gets wider or narrower."""
+        for page_number, label in self.labels.items():
+            label.move(*self.page_geometry(page_number)[:2])
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        """Paint blank placeholders for the pages that have no render yet."""
+        painter = QPainter(self)
+        for page_number in self.visible_pages():
+            label = self.labels.get(page_number)
+            if label is None or label.key is None:
+                painter.fillRect(*self.page_geometry(page_number), QColor(Qt.white))
+        painter.end()
@@ -0,0 +1,249 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+# Word types. A rule only applies to a word of one of its input types and
+# the word it produces is of its output types, which is how chains like
+# 書かなかった -> 書かない -> 書く are kept from going astray.
+V1 = 1 << 0        # Ichidan verb
+V5 = 1 << 1        # Godan verb
+VK = 1 << 2        # Kuru verb
+VS_I = 1 << 3      # Suru verb, する included in the headword
+VS = 1 << 4        # Noun that takes する
+ADJ_I = 1 << 5     # I-adjective
+TE = 1 << 6        # Te-form, only an intermediate step
+START = 1 << 7     # The surface form as selected
+
+DICTIONARY_FORMS = V1 | V5 | VK | VS_I | VS | ADJ_I
+
+# Longest surface form worth trying to deinflect
+MAX_INFLECTED_LENGTH = 12
+
+# Godan dictionary ending: i-stem, a-stem, e-stem, o-stem, te-form, ta-form
+GODAN_ENDINGS = {
+    'う': ('い', 'わ', 'え', 'お', 'って', 'った'),
+    'く': ('き', 'か', 'け', 'こ', 'いて', 'いた'),
+    'ぐ': ('ぎ', 'が', 'げ', 'ご', 'いで', 'いだ'),
+    'す': ('し', 'さ', 'せ', 'そ', 'して', 'した'),
+    'つ': ('ち', 'た', 'て', 'と', 'って', 'った'),
+    'ぬ': ('に', 'な', 'ね', 'の', 'んで', 'んだ'),
+    'ぶ': ('び', 'ば', 'べ', 'ぼ', 'んで', 'んだ'),
+    'む': ('み', 'ま', 'め', 'も', 'んで', 'んだ'),
+    'る': ('り', 'ら', 'れ', 'ろ', 'って', 'った'),
+}
+
+
+def verb_rules(ending, out_type, i_stem, a_stem, e_stem, te, ta, potential, passive, causative, volitional, imperative):
+    """Build the rules for one verb ending from the forms of its stems."""
+    return [
+        # Polite
+        (i_stem + 'ます', ending, START, out_type, 'polite'),
+        (i_stem + 'ました', ending, START, out_type, 'polite past'),
+        (i_stem + 'ません', ending, START, out_type, 'polite negative'),
+        (i_stem + 'ませんでした', ending, START, out_type, 'polite past negative'),
+        (i_stem + 'ましょう', ending, START, out_type, 'polite volitional'),
+        (i_stem + 'ましょうか', ending, START, out_type, 'polite volitional'),
+        # Stems that carry on as other words
+        (i_stem + 'たい', ending, ADJ_I | START, out_type, 'want'),
+        (i_stem + 'ながら', ending, START, out_type, 'while'),
+        (i_stem + 'なさい', ending, START, out_type, 'polite imperative'),
+        (i_stem + 'そう', ending, START, out_type, 'seemingness'),
+        (a_stem + 'ない', ending, ADJ_I | START, out_type, 'negative'),
+        (a_stem + 'ず', ending, START, out_type, 'negative'),
+        (a_stem + 'ずに', ending, START, out_type, 'without'),
+        (a_stem + 'なければ', ending, START, out_type, 'must'),
+        (a_stem + 'なくては', ending, START, out_type, 'must'),
+        # Plain forms
+        (te, ending, TE | START, out_type, 'te'),
+        (ta, ending, START, out_type, 'past'),
+        (ta + 'ら', ending, START, out_type, 'conditional'),
+        (ta + 'り', ending, START, out_type, 'tari'),
+        (e_stem + 'ば', ending, START, out_type, 'provisional'),
+        (volitional, ending, START, out_type, 'volitional'),
+        (imperative, ending, START, out_type, 'imperative'),
+        # Forms that conjugate as ichidan verbs themselves
+        (potential, ending, V1 | START, out_type, 'potential'),
+        (passive, ending, V1 | START, out_type, 'passive'),
+        (causative, ending, V1 | START, out_type, 'causative'),
+    ]
+
+
+def build_rules():
+    """Build the deinflection rule table as (suffix, replacement, in types, out type, reason)."""
+    rules = []
+
+    for ending, (i, a, e, o, te, ta) in GODAN_ENDINGS.items():
+        # Godan potential and passive are both ichidan verbs, the volitional is the o-stem plus う
+        rules += verb_rules(ending, V5, i, a, e, te, ta,
+                            potential=e + 'る', passive=a + 'れる', causative=a + 'せる',
+                            volitional=o + 'う', imperative=e)
+    # 行く is the one godan verb with an irregular te/ta-form
+    for stem in ('行', 'い'):
+        rules += [
+            (stem + 'って', stem + 'く', TE | START, V5, 'te'),
+            (stem + 'った', stem + 'く', START, V5, 'past'),
+            (stem + 'ったら', stem + 'く', START, V5, 'conditional'),
+            (stem + 'ったり', stem + 'く', START, V5, 'tari'),
+        ]
+
+    # Ichidan verbs just drop る; the stem itself is both the i- and a-stem
+    rules += verb_rules('る', V1, '', '', 'れ', 'て', 'た',
+                        potential='られる', passive='られる', causative='させる',
+                        volitional='よう', imperative='ろ')
+
+    # Kuru changes its vowel in kana but not in kanji
+    for i, a, u, ending in (('来', '来', '来', '来る'), ('き', 'こ', 'く', 'くる')):
+        rules += [(suffix.replace('@i', i).replace('@a', a).replace('@u', u), ending, types, VK, reason)
+                  for suffix, types, reason in (
+                      ('@iます', START, 'polite'), ('@iました', START, 'polite past'),
+                      ('@iません', START, 'polite negative'), ('@iませんでした', START, 'polite past negative'),
+                      ('@iましょう', START, 'polite volitional'), ('@iたい', ADJ_I | START, 'want'),
+                      ('@iて', TE | START, 'te'), ('@iた', START, 'past'), ('@iたら', START, 'conditional'),
+                      ('@aない', ADJ_I | START, 'negative'), ('@aず', START, 'negative'),
+                      ('@aられる', V1 | START, 'potential'), ('@aれる', V1 | START, 'potential'),
+                      ('@aさせる', V1 | START, 'causative'), ('@aよう', START, 'volitional'),
+                      ('@aい', START, 'imperative'), ('@uれば', START, 'provisional'),
+                  )]
+
+    # Suru verbs, producing the する form that the noun rule below can strip
+    rules += [(suffix, 'する', types, VS_I, reason) for suffix, types, reason in (
+        ('します', START, 'polite'), ('しました', START, 'polite past'),
+        ('しません', START, 'polite negative'), ('しませんでした', START, 'polite past negative'),
+        ('しましょう', START, 'polite volitional'), ('したい', ADJ_I | START, 'want'),
+        ('しながら', START, 'while'), ('しなさい', START, 'polite imperative'),
+        ('して', TE | START, 'te'), ('した', START, 'past'), ('したら', START, 'conditional'),
+        ('したり', START, 'tari'), ('しない', ADJ_I | START, 'negative'), ('せず', START, 'negative'),
+        ('できる', V1 | START, 'potential'), ('される', V1 | START, 'passive'),
+        ('させる', V1 | START, 'causative'), ('しよう', START, 'volitional'),
+        ('しろ', START, 'imperative'), ('すれば', START, 'provisional'),
+    )]
+    rules.append(('する', '', VS_I | START, VS, 'suru'))
+
+    # I-adjectives
+    rules += [(suffix, 'い', types, ADJ_I, reason) for suffix, types, reason in (
+        ('かった', ADJ_I | START, 'past'), ('くない', ADJ_I | START, 'negative'),
+        ('くなかった', ADJ_I | START, 'past negative'), ('くて', START, 'te'),
+        ('く', START, 'adverbial'), ('ければ', START, 'provisional'),
+        ('かったら', START, 'conditional'), ('さ', START, 'noun'),
+        ('そう', START, 'seemingness'), ('すぎる', V1 | START, 'too'),
+    )]
+    # いい conjugates from よい
+    rules += [('よかった', 'いい', ADJ_I | START, ADJ_I, 'past'),
+              ('よくない', 'いい', ADJ_I | START, ADJ_I, 'negative'),
+              ('よくて', 'いい', START, ADJ_I, 'te'),
+              ('よければ', 'いい', START, ADJ_I, 'provisional')]
+
+    # Auxiliaries that hang off the te-form
+    rules += [(suffix, replacement, types, TE, reason) for suffix, replacement, types, reason in (
+        ('ている', 'て', V1 | START, 'progressive'), ('てる', 'て', V1 | START, 'progressive'),
+        ('でいる', 'で', V1 | START, 'progressive'), ('でる', 'で', V1 | START, 'progressive'),
+        ('てしまう', 'て', V5 | START, 'completion'), ('でしまう', 'で', V5 | START, 'completion'),
+        ('ちゃう', 'て', V5 | START, 'completion'), ('じゃう', 'で', V5 | START, 'completion'),
+        ('ておく', 'て', V5 | START, 'in advance'), ('でおく', 'で', V5 | START, 'in advance'),
+        ('てある', 'て', V5 | START, 'resultative'), ('である', 'で', V5 | START, 'resultative'),
+        ('てください', 'て', START, 'request'), ('でください', 'で', START, 'request'),
+    )]
+
+    # Index by suffix so a word only tries the rules that can match it
+    by_suffix = {}
+    for rule in rules:
+        by_suffix.setdefault(rule[0], []).append(rule)
+    return by_suffix
+
+
+RULES = build_rules()
+SUFFIX_LENGTHS = sorted({len(suffix) for suffix in RULES}, reverse=True)
+
+
+@lru_cache(maxsize=16384)
+def deinflection_candidates(word):
+    """Get every (base form, word types, reasons) the word could be an inflection of.
+
+    Cached by surface form, so a word that appears again costs nothing.
+    """
+    candidates = []
+    seen = {(word, START)}
+    queue = [(word, START | DICTIONARY_FORMS | TE, ())]
+    while queue:
+        current, types, reasons = queue.pop(0)
+        for length in SUFFIX_LENGTHS:
+            if length > len(current):
+                continue
+            for _, replacement, in_types, out_type, reason in RULES.get(current[-length:], ()):
+                if not types & in_types:
+                    continue
+                base = current[:len(current) - length] + replacement
+                if not base or (base, out_type) in seen:
+                    continue
+                seen.add((base, out_type))
+                candidate = (base, out_type, reasons + (reason,))
+                candidates.append(candidate)
+                queue.append(candidate)
+    return tuple(candidates)
+
+
+def pos_types(tags):
+    """Map JMdict part of speech tags (expanded or as entity names) to word types."""
+    types = 0
+    for tag in tags:
+        if tag.startswith('Ichidan verb') or tag in ('v1', 'v1-s'):
+            types |= V1
+        elif tag.startswith('Godan verb') or tag.startswith('v5'):
+            types |= V5
+        elif tag.startswith('Kuru verb') or tag == 'vk':
+            types |= VK
+        elif tag in ('suru verb - included', 'suru verb - special class', 'vs-i', 'vs-s'):
+            types |= VS_I
+        elif tag.startswith('noun or participle which takes the aux. verb suru') or tag == 'vs':
+            types |= VS
+        elif tag.startswith('adjective (keiyoushi)') or tag in ('adj-i', 'adj-ix'):
+            types |= ADJ_I
+    return types
+
+
+class Deinflector:
+    def __init__(self, dictionary, cache_size=4096):
+        """Resolve inflected words to dictionary forms using a JMDict."""
+        self.dictionary = dictionary
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # Lookups come from the GUI thread and background workers alike
+        self._cache_lock = threading.Lock()
+
+    def lookup(self, word):
+        """Get (base form, reasons, entries) for each dictionary form the word inflects.
+
+        Only entries whose part of speech fits the inflection are returned.
+        """
+        with self._cache_lock:
+            if word in self._cache:
+                self._cache.move_to_end(word)
+                return self._cache[word]
+
+        trie = self.dictionary.get_trie()
+        results = []
+        for base, types, reasons in deinflection_candidates(word):
+            if not types & DICTIONARY_FORMS or base not in trie:
+                continue
+            entries = [entry for entry in self.dictionary.search_word(base) or ()
+                       if pos_types(entry.tags) & types]
+            if entries:
+                results.append((base, reasons, entries))
+
+        with self._cache_lock:
+            self._cache[word] = results
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def matches_at(self, text, start):
+        """Get (end, base form) for every inflected word starting at text[start]."""
+        matches = []
+        limit = min(len(text), start + MAX_INFLECTED_LENGTH)
+        for end in range(start + 2, limit + 1):
+            # Inflections always end in kana
+            if not '\u3040' <= text[end - 1] <= '\u30FF':
+                continue
+            for base, _, _ in self.lookup(text[start:end]):
+                matches.append((end, base))
+        return matches
@@ -1,41 +1,286 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
 import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from deinflect import Deinflector
+from perf import timed
+from trie import WordTrie
+
+# Bump whenever the layout of the compiled index changes so old files get rebuilt.
+INDEX_VERSION = 2
+
+# Separates the items of a list field in the compiled index
+FIELD_SEP = '\x1f'
+
+
+class Entry:
+    """A dictionary entry decoded from the compiled index."""
+    __slots__ = ('id', 'word', 'reading', 'kanji', 'readings', 'tags', 'meaning', 'notes', 'priority')
+
+    def __init__(self, id, word, reading, kanji, readings, tags, meaning, notes, priority):
+        self.id = id
+        self.word = word
+        self.reading = reading
+        self.kanji = kanji
+        self.readings = readings
+        self.tags = tags
+        self.meaning = meaning
+        self.notes = notes
+        self.priority = priority
+
+    def __repr__(self):
+        return f"Entry({self.id}, {self.word!r}, {self.reading!r})"
+
 
 class JMDict:
-    def __init__(self, xml_file):
-        """Initialize JMDict with an XML file."""
-        self.entries = self.load_entries(xml_file)
-
-    def load_entries(self, xml_file):
-        """Load all entries from the XML file into a dictionary of entries."""
-        all_entries = {}
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        for entry in root.findall('entry'):
-            word_key = self.get_keb(entry)
-            if word_key not in all_entries:
-                all_entries[word_key] = []
-
-            entry_data = {
-                'word': word_key,
-                'reading': self.get_reb(entry),
-                'tags': self.get_tags(entry),
-                'meaning': self.get_meaning(entry),
-                'notes': self.get_s_inf(entry),
-            }
-            all_entries[word_key].append(entry_data)
-
-        return all_entries
-
-    def get_keb(self, entry):
-        """Get the key word (kanji)."""
-        keb = entry.find('k_ele/keb')
-        return keb.text if keb is not None else ''
-
-    def get_reb(self, entry):
-        """Get the reading (kana)."""
-        reb = entry.find('r_ele/reb')
-        return reb.text if reb is not None else ''
+    def __init__(self, xml_file, index_file=None, load=True):
+        """Initialize JMDict with an XML file, compiling it to an index if needed.
+
+        Pass load=False and call start_loading() to load in a worker thread instead.
+        """
+        self.xml_file = xml_file
+        self.index_file = index_file or os.path.splitext(xml_file)[0] + '.sqlite'
+        self._local = threading.local()
+        self.ready = threading.Event()
+        self.progress = 0.0
+        self.error = None
+        self._trie = None
+        self._trie_lock = threading.Lock()
+        self.deinflector = Deinflector(self)
+        if load:
+            self.load_entries()
+
+    @timed('dictionary_load')
+    def load_entries(self, progress_callback=None):
+        """Make sure the compiled index is up to date and open it."""
+        if self.index_is_stale():
+            self.compile_index(progress_callback)
+        self.connection()
+        self.progress = 1.0
+        self.ready.set()
+
+    def start_loading(self, progress_callback=None, done_callback=None):
+        """Load the dictionary in a background thread.
+
+        progress_callback gets the fraction loaded (0.0 - 1.0) and done_callback
+        gets None on success or the exception that stopped the load. Both are
+        called from the worker thread.
+        """
+        def run():
+            try:
+                self.load_entries(progress_callback)
+                # Build the segmentation trie now rather than on the first lookup
+                self.get_trie()
+            except Exception as e:
+                self.error = e
+                # Wake up anyone waiting on a lookup so they see the error
+                self.ready.set()
+            if done_callback:
+                done_callback(self.error)
+
+        thread = threading.Thread(target=run, name='JMDict loader', daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        """Check whether lookups can be answered without waiting."""
+        return self.ready.is_set()
+
+    # Compiled index
+
+    def connection(self):
+        """Get this thread's read-only connection to the compiled index."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(self.index_file).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def source_signature(self):
+        """Get the mtime and size of the source XML."""
+        stat = os.stat(self.xml_file)
+        return str(stat.st_mtime_ns), str(stat.st_size)
+
+    def source_hash(self):
+        """Hash the source XML so a touched but unchanged file doesn't force a rebuild."""
+        digest = hashlib.sha1()
+        with open(self.xml_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def read_meta(self):
+        """Read the metadata stored in the compiled index."""
+        try:
+            conn = sqlite3.connect(self.index_file)
+            try:
+                return dict(conn.execute('SELECT key, value FROM meta'))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+    def index_is_stale(self):
+        """Check whether the compiled index is missing or older than the source XML."""
+        if not os.path.exists(self.index_file):
+            return True
+
+        meta = self.read_meta()
+        if meta.get('version') != str(INDEX_VERSION):
+            return True
+
+        mtime, size = self.source_signature()
+        if meta.get('source_mtime') == mtime and meta.get('source_size') == size:
+            return False
+
+        # The file was touched; only rebuild if its contents actually changed.
+        if meta.get('source_hash') != self.source_hash():
+            return True
+
+        conn = sqlite3.connect(self.index_file)
+        with conn:
+            conn.executemany('REPLACE INTO meta VALUES (?, ?)',
+                             [('source_mtime', mtime), ('source_size', size)])
+        conn.close()
+        return False
+
+    def compile_index(self, progress_callback=None):
+        """Compile the source XML into the on-disk index."""
+        tmp_file = self.index_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+        mtime, size = self.source_signature()
+        conn = sqlite3.connect(tmp_file)
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            # Entry payloads are stored once; every kanji and kana form points at them through keys
+            conn.execute('CREATE TABLE entries ('
+                         'id INTEGER PRIMARY KEY, word TEXT NOT NULL, kanji TEXT, readings TEXT, '
+                         'tags TEXT, meaning TEXT, notes TEXT)')
+            conn.execute('CREATE TABLE keys ('
+                         'key TEXT NOT NULL, entry_id INTEGER NOT NULL, priority INTEGER, reading TEXT, '
+                         'PRIMARY KEY (key, entry_id)) WITHOUT ROWID')
+
+            entry_rows = []
+            key_rows = []
+            for entry_id, entry in enumerate(self.iter_entries(progress_callback), 1):
+                kanji = self.get_kebs(entry)
+                readings = self.get_rebs(entry)
+                forms = {}
+                for keb, pri in kanji:
+                    reading = next((reb for reb, _, restr in readings if restr is None or keb in restr), '')
+                    forms.setdefault(keb, (self.form_priority(pri), reading))
+                for reb, pri, _ in readings:
+                    forms.setdefault(reb, (self.form_priority(pri), reb))
+                if not forms:
+                    continue
+
+                word = kanji[0][0] if kanji else readings[0][0]
+                entry_rows.append((
+                    entry_id,
+                    word,
+                    FIELD_SEP.join(keb for keb, _ in kanji),
+                    FIELD_SEP.join(reb for reb, _, _ in readings),
+                    FIELD_SEP.join(self.get_tags(entry)),
+                    FIELD_SEP.join(self.get_meaning(entry)),
+                    FIELD_SEP.join(self.get_s_inf(entry)),
+                ))
+                key_rows.extend((key, entry_id, priority, reading) for key, (priority, reading) in forms.items())
+
+                # Write in batches so memory stays flat however big the source is
+                if len(entry_rows) >= 5000:
+                    self.insert_rows(conn, entry_rows, key_rows)
+            self.insert_rows(conn, entry_rows, key_rows)
+
+            # Build the index after the bulk insert, it's much faster than maintaining it
+            conn.execute('CREATE INDEX keys_priority ON keys (key, priority, entry_id)')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(INDEX_VERSION)),
+                ('source_mtime', mtime),
+                ('source_size', size),
+                ('source_hash', self.source_hash()),
+            ])
+        conn.close()
+
+        os.replace(tmp_file, self.index_file)
+
+    def insert_rows(self, conn, entry_rows, key_rows):
+        """Write a batch of entries and their keys, then empty the batch."""
+        conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)', entry_rows)
+        conn.executemany('INSERT OR IGNORE INTO keys VALUES (?, ?, ?, ?)', key_rows)
+        entry_rows.clear()
+        key_rows.clear()
+
+    def decode_entry(self, row):
+        """Turn a row of the compiled index into an entry."""
+        entry_id, word, reading, kanji, readings, tags, meaning, notes, priority = row
+        return Entry(
+            entry_id, word, reading,
+            self.split_field(kanji),
+            self.split_field(readings),
+            self.split_field(tags),
+            self.split_field(meaning),
+            self.split_field(notes),
+            priority,
+        )
+
+    def split_field(self, value):
+        """Split a list field of the compiled index."""
+        return tuple(value.split(FIELD_SEP)) if value else ()
+
+    # XML parsing
+
+    def iter_entries(self, progress_callback=None):
+        """Stream <entry> elements from the source XML, freeing each one once used."""
+        total = os.path.getsize(self.xml_file) or 1
+        reported = -1
+        with open(self.xml_file, 'rb') as f:
+            root = None
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if root is None:
+                    root = elem
+                if event != 'end' or elem.tag != 'entry':
+                    continue
+
+                yield elem
+
+                # Drop the finished entry so the tree never grows
+                root.clear()
+
+                self.progress = min(f.tell() / total, 0.99)
+                percent = int(self.progress * 100)
+                if progress_callback and percent != reported:
+                    reported = percent
+                    progress_callback(self.progress)
+
+    def get_kebs(self, entry):
+        """Get every kanji form with its priority tags."""
+        kebs = []
+        for k_ele in entry.findall('k_ele'):
+            keb = k_ele.find('keb')
+            if keb is not None and keb.text:
+                kebs.append((keb.text, [pri.text for pri in k_ele.findall('ke_pri')]))
+        return kebs
+
+    def get_rebs(self, entry):
+        """Get every reading (kana) with its priority tags and the kanji forms it is restricted to."""
+        rebs = []
+        for r_ele in entry.findall('r_ele'):
+            reb = r_ele.find('reb')
+            if reb is None or not reb.text:
+                continue
+            if r_ele.find('re_nokanji') is not None:
+                restr = set()
+            else:
+                restr = {re_restr.text for re_restr in r_ele.findall('re_restr')} or None
+            rebs.append((reb.text, [pri.text for pri in r_ele.findall('re_pri')], restr))
+        return rebs
 
     def get_tags(self, entry):
         """Get tags (e.g., part of speech)."""
@@ -61,22 +306,95 @@ class JMDict:
                 meanings.append(gloss.text)
         return meanings
 
+    # Lookup
+
+    @timed('search_word')
     def search_word(self, word):
-        """Search for a word in the dictionary."""
-        if word in self.entries:
-            results = self.entries[word]
-            results.sort(key=lambda x: self.tag_priority(x['tags']))
-            return results
+        """Search for a word in the dictionary, waiting for it to finish loading."""
+        self.ready.wait()
+        if self.error is not None:
+            raise RuntimeError(f"Dictionary failed to load: {self.error}") from self.error
+        rows = self.connection().execute(
+            'SELECT e.id, e.word, k.reading, e.kanji, e.readings, e.tags, e.meaning, e.notes, k.priority '
+            'FROM keys k JOIN entries e ON e.id = k.entry_id '
+            'WHERE k.key = ? ORDER BY k.priority, k.entry_id', (word,)).fetchall()
+        if rows:
+            return [self.decode_entry(row) for row in rows]
         return None
 
-    def tag_priority(self, tags):
-        """Define priority based on tags (common first, rare last)."""
+    def get_trie(self):
+        """Get the prefix trie of every headword, building it on first use."""
+        with self._trie_lock:
+            if self._trie is None:
+                self.ready.wait()
+                rows = self.connection().execute('SELECT DISTINCT key FROM keys')
+                self._trie = WordTrie(word for word, in rows)
+            return self._trie
+
+    def find_words(self, text, longest=False, deinflect=True):
+        """Find the dictionary words in a text as (start, end, word) tuples.
+
+        By default every match is returned, overlapping ones included. With
+        longest=True the text is split greedily into the longest matches.
+        Inflected words are matched too, with word set to the dictionary form.
+        """
+        trie = self.get_trie()
+        if not deinflect:
+            return trie.find_longest(text) if longest else trie.find_all(text)
+
+        matches = []
+        start = 0
+        while start < len(text):
+            found = self.matches_at(text, start)
+            if longest:
+                if found:
+                    end, word = max(found, key=lambda match: match[0])
+                    matches.append((start, end, word))
+                    start = end
+                    continue
+            else:
+                matches.extend(sorted({(start, end, word) for end, word in found}))
+            start += 1
+        return matches
+
+    def find_words_batch(self, texts, longest=False, deinflect=True):
+        """Run find_words over several texts, for callers that pay per call."""
+        return [self.find_words(text, longest, deinflect) for text in texts]
+
+    def matches_at(self, text, start):
+        """Get (end, word) for every dictionary word, inflected ones included, starting at a position."""
+        found = [(end, text[start:end]) for end in self.get_trie().prefix_ends(text, start)]
+        found += self.deinflector.matches_at(text, start)
+        return found
+
+    def longest_match(self, text, start=0):
+        """Get (end, word) for the longest dictionary word starting at a position, or None."""
+        found = self.matches_at(text, start)
+        return max(found, key=lambda match: match[0]) if found else None
+
+    def lookup(self, word):
+        """Get (dictionary form, reasons, entries) for a word, deinflecting it if it isn't a headword."""
+        entries = self.search_word(word)
+        if entries:
+            return [(word, (), entries)]
+        return self.deinflector.lookup(word)
+
+    def form_priority(self, pri_tags):
+        """Define priority from ke_pri/re_pri tags (common first, rare last)."""
         priority = 100
-        if 'ichi' in tags:
-            return 0
-        elif 'news' in tags:
-            return 1
-        elif 'rare' in tags:
-            return 99
+        for tag in pri_tags:
+            if tag.startswith('nf'):
+                # Frequency band in the newspaper corpus, nf01 is the most common
+                priority = min(priority, int(tag[2:]))
+            elif tag.endswith('1'):
+                priority = min(priority, 25)
+            elif tag.endswith('2'):
+                priority = min(priority, 60)
         return priority
-    
\ No newline at end of file
+
+
+if __name__ == '__main__':
+    # Compile the index ahead of time: python dictionary.py [JMdict.xml]
+    xml_file = sys.argv[1] if len(sys.argv) > 1 else './JMdict.xml'
+    dictionary = JMDict(xml_file)
+    print(f"Index ready: {dictionary.index_file}")
@@ -0,0 +1,303 @@
+"""Share one loaded dictionary between reader windows and tools.
+
+    python dictionary_server.py [JMdict.xml] [--socket PATH]
+
+The server loads the dictionary once and answers requests on a Unix socket.
+open_dictionary() hands out a client with the JMDict API when a server is
+running, and a JMDict of its own otherwise.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+
+from dictionary import Entry, JMDict
+
+# Where the server listens unless JPDF_DICTIONARY_SOCKET says otherwise
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f'jpdf-dictionary-{os.getuid()}.sock')
+
+# Entry fields that are tuples, which JSON turns into lists
+ENTRY_TUPLE_FIELDS = ('kanji', 'readings', 'tags', 'meaning', 'notes')
+
+
+def socket_path():
+    return os.environ.get('JPDF_DICTIONARY_SOCKET', DEFAULT_SOCKET)
+
+
+def encode_entries(entries):
+    return [[getattr(entry, field) for field in Entry.__slots__] for entry in entries or ()]
+
+
+def decode_entries(rows):
+    entries = []
+    for row in rows:
+        fields = dict(zip(Entry.__slots__, row))
+        for field in ENTRY_TUPLE_FIELDS:
+            fields[field] = tuple(fields[field])
+        entries.append(Entry(**fields))
+    return entries
+
+
+class DictionaryRequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests, {"method": ..., "params": [...]}, one per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.call(request['method'], request.get('params', []))
+                response = {'result': result}
+            except Exception as e:
+                response = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+class DictionaryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, dictionary, path):
+        self.dictionary = dictionary
+        # Requests are answered one at a time: lookups are short and CPU-bound, so under
+        # the GIL running them side by side would only add thread switching
+        self.lock = threading.Lock()
+        super().__init__(path, DictionaryRequestHandler)
+
+    def call(self, method, params):
+        dictionary = self.dictionary
+        with self.lock:
+            if method == 'ping':
+                return True
+            if method == 'search_word':
+                entries = dictionary.search_word(*params)
+                return encode_entries(entries) if entries else None
+            if method == 'lookup':
+                return [[base, list(reasons), encode_entries(entries)]
+                        for base, reasons, entries in dictionary.lookup(*params)]
+            if method in ('find_words', 'find_words_batch', 'matches_at', 'longest_match'):
+                return getattr(dictionary, method)(*params)
+        raise ValueError(f"unknown method {method!r}")
+
+
+class DictionaryClient:
+    """The lookup side of the JMDict API, answered by a dictionary server.
+
+    If the server goes away, the client loads the dictionary itself in the
+    background and carries on with that once it is ready.
+    """
+
+    def __init__(self, xml_file, path=None):
+        self.xml_file = xml_file
+        self.path = path or socket_path()
+        self._local = threading.local()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.progress = 0.0
+        self.error = None
+        # Given to start_loading, and passed on from the fallback dictionary's loading
+        self.progress_callback = None
+        self.done_callback = None
+
+    def connect(self):
+        """Get this thread's connection to the server."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def call(self, method, *params):
+        """Ask the server, getting None if it couldn't answer."""
+        if self._fallback is None:
+            try:
+                sock, reader = self.connect()
+                sock.sendall(json.dumps({'method': method, 'params': params}, ensure_ascii=False).encode('utf-8') + b'\n')
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("dictionary server closed the connection")
+                response = json.loads(line)
+                if 'error' in response:
+                    # Only this request failed; the lookups calling from Qt slots and workers carry on
+                    print(f"Dictionary server error in {method}: {response['error']}", file=sys.stderr)
+                    return None
+                return response['result']
+            except OSError:
+                conn = getattr(self._local, 'conn', None)
+                if conn is not None:
+                    conn[0].close()
+                    self._local.conn = None
+                self.fall_back()
+        return None
+
+    def fall_back(self):
+        """Start loading the dictionary in this process, once, after losing the server.
+
+        It loads in the background, which may be the GUI thread calling;
+        until it is ready lookups come back empty and is_ready() is False.
+        """
+        with self._fallback_lock:
+            if self._fallback is None:
+                self.progress = 0.0
+                fallback = JMDict(self.xml_file, load=False)
+                fallback.start_loading(progress_callback=self.fallback_progress, done_callback=self.fallback_loaded)
+                self._fallback = fallback
+
+    def fallback_progress(self, fraction):
+        self.progress = fraction
+        if self.progress_callback:
+            self.progress_callback(fraction)
+
+    def fallback_loaded(self, error):
+        if error is not None:
+            self.error = error
+        self.loaded()
+
+    def loaded(self):
+        """Mark the dictionary ready and tell whoever started loading it."""
+        self.progress = 1.0
+        self.ready.set()
+        if self.progress_callback:
+            self.progress_callback(1.0)
+        if self.done_callback:
+            self.done_callback(self.error)
+
+    def local(self):
+        """Get the in-process dictionary if it has taken over from the server, or None.
+
+        Returns False while it is still loading.
+        """
+        fallback = self._fallback
+        if fallback is None:
+            return None
+        return fallback if fallback.is_ready() else False
+
+    def start_loading(self, progress_callback=None, done_callback=None):
+        """Check the server is answering, in a background thread like JMDict.start_loading.
+
+        If it isn't, the callbacks follow the dictionary loading here instead.
+        """
+        self.progress_callback = progress_callback
+        self.done_callback = done_callback
+
+        def run():
+            try:
+                if not self.call('ping') and self._fallback is None:
+                    raise ConnectionError("dictionary server did not answer")
+            except Exception as e:
+                self.error = e
+            fallback = self._fallback
+            # A fallback still loading calls loaded() when it is done
+            if fallback is None or fallback.is_ready():
+                self.loaded()
+
+        thread = threading.Thread(target=run, name='JMDict client', daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        return self.ready.is_set() and self.local() is not False
+
+    def search_word(self, word):
+        rows = self.call('search_word', word)
+        local = self.local()
+        if local is not None:
+            return local.search_word(word) if local else None
+        return decode_entries(rows) if rows else None
+
+    def lookup(self, word):
+        results = self.call('lookup', word)
+        local = self.local()
+        if local is not None:
+            return local.lookup(word) if local else []
+        return [(base, tuple(reasons), decode_entries(entries)) for base, reasons, entries in results or ()]
+
+    def find_words(self, text, longest=False, deinflect=True):
+        matches = self.call('find_words', text, longest, deinflect)
+        local = self.local()
+        if local is not None:
+            return local.find_words(text, longest, deinflect) if local else []
+        return [tuple(match) for match in matches or ()]
+
+    def find_words_batch(self, texts, longest=False, deinflect=True):
+        results = self.call('find_words_batch', list(texts), longest, deinflect)
+        local = self.local()
+        if local is not None:
+            return local.find_words_batch(texts, longest, deinflect) if local else [[] for _ in texts]
+        if results is None:
+            return [[] for _ in texts]
+        return [[tuple(match) for match in matches] for matches in results]
+
+    def matches_at(self, text, start):
+        matches = self.call('matches_at', text, start)
+        local = self.local()
+        if local is not None:
+            return local.matches_at(text, start) if local else []
+        return [tuple(match) for match in matches or ()]
+
+    def longest_match(self, text, start=0):
+        match = self.call('longest_match', text, start)
+        local = self.local()
+        if local is not None:
+            return local.longest_match(text, start) if local else None
+        return tuple(match) if match else None
+
+
+def server_running(path=None):
+    """Check whether a dictionary server is listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def open_dictionary(xml_file, path=None):
+    """Get a client of the running dictionary server, or a JMDict of our own if there is none.
+
+    Either way the dictionary still has to be started with start_loading().
+    """
+    if server_running(path):
+        return DictionaryClient(xml_file, path)
+    return JMDict(xml_file, load=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one loaded dictionary to every reader window and tool.")
+    parser.add_argument('xml_file', nargs='?', default='./JMdict.xml', help="JMdict XML file (default: ./JMdict.xml)")
+    parser.add_argument('--socket', default=socket_path(), help=f"socket to listen on (default: {socket_path()})")
+    args = parser.parse_args(argv)
+
+    if server_running(args.socket):
+        print(f"A dictionary server is already listening on {args.socket}", file=sys.stderr)
+        return 1
+    if os.path.exists(args.socket):
+        # Left behind by a server that didn't shut down cleanly
+        os.remove(args.socket)
+
+    dictionary = JMDict(args.xml_file)
+    dictionary.get_trie()
+    server = DictionaryServer(dictionary, args.socket)
+    print(f"Serving {args.xml_file} on {args.socket}", file=sys.stderr)
+    # Clean up the socket when killed as well as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+from highlights import HighlightSaver, apply_sidecar
+from notes_store import document_hash
+
+# Documents whose MuPDF handles stay open; the ones read longest ago are closed
+MAX_OPEN_DOCUMENTS = 3
+
+
+class Document:
+    """An open PDF and the reader's place in it.
+
+    Everything else about a document is cached under its path and kept
+    while other documents are read. The MuPDF handle is closed when the
+    document has been in the background a while and opened again the
+    next time it is used.
+    """
+
+    def __init__(self, path, doc):
+        self.path = path
+        self.doc = doc  # MuPDF handle, None while closed
+        self.hash = document_hash(path)  # Identifies the book in the notes store
+        self.page_rects = [page.rect for page in doc]
+        self.current_page = 0
+        self.highlight_saver = HighlightSaver(path)
+        # Highlights that could not be saved into the PDF are only in our handle
+        self.unsaved_pages = apply_sidecar(doc, path)  # Pages the render workers would draw without them
+        self.annot_revisions = {page_number: 1 for page_number in self.unsaved_pages}
+
+    def __len__(self):
+        return len(self.page_rects)
+
+    def is_open(self):
+        return self.doc is not None
+
+    def open(self):
+        """Get the MuPDF handle, opening the file again if it was closed."""
+        if self.doc is None:
+            import fitz
+            self.doc = fitz.open(self.path)
+            # The revisions of pages with sidecar highlights are kept from before, as their renders are
+            apply_sidecar(self.doc, self.path)
+            self.highlight_saver = HighlightSaver(self.path)
+        return self.doc
+
+    def close(self):
+        """Close the MuPDF handle once its pending highlights are saved.
+
+        Returns False, leaving the handle open, if they couldn't be saved.
+        """
+        if self.doc is None:
+            return True
+        try:
+            self.highlight_saver.flush()
+        except OSError:
+            return False
+        self.doc.close()
+        self.doc = None
+        self.highlight_saver = None
+        return True
@@ -0,0 +1,234 @@
+import threading
+
+from PyQt5.QtCore import QObject, QPointF, pyqtSignal
+from PyQt5.QtGui import QFont, QStaticText
+
+from page_cache import PageCache
+from perf import recorder
+from text_layout import PageTextLayout
+
+# Memory the readings of pages, and the glyph runs drawn from them, may use
+READING_CACHE_BUDGET = 8 * 1024 * 1024
+GLYPH_CACHE_BUDGET = 16 * 1024 * 1024
+# Pages after the one painted that are annotated ahead of time
+ANNOTATE_AHEAD = 2
+# Pages waiting to be annotated; older requests beyond this were scrolled past
+MAX_QUEUED = 8
+# Size of the reading relative to the text it is written over
+RUBY_SIZE = 0.5
+
+
+def is_kanji(c):
+    return '\u4E00' <= c <= '\u9FAF'
+
+
+def kanji_reading(word, reading):
+    """Trim the kana a word is written with from its reading, leaving the reading of its kanji.
+
+    食べる read たべる gives た. If the kana don't line up with the reading,
+    the whole reading is kept.
+    """
+    kanji = [i for i, c in enumerate(word) if is_kanji(c)]
+    prefix, suffix = word[:kanji[0]], word[kanji[-1] + 1:]
+    if len(reading) > len(prefix) + len(suffix) and reading.startswith(prefix) and reading.endswith(suffix):
+        return reading[len(prefix):len(reading) - len(suffix)]
+    return reading
+
+
+def word_reading(dictionary, surface, base):
+    """Get the reading of the kanji of a word as written, base being its dictionary form."""
+    for form, _, entries in dictionary.lookup(surface):
+        if form == base and entries and entries[0].reading:
+            return kanji_reading(base, entries[0].reading)
+    return None
+
+
+def page_readings(dictionary, layout):
+    """Get (x0, y0, x1, y1, reading, vertical) for every word with kanji on a page.
+
+    The box covers the word's kanji, in PDF coordinates. Each line is split
+    into its longest dictionary words, all lines in one batch.
+    """
+    lines = [layout.line_text(line) for line in range(len(layout.line_starts))]
+    matches = dictionary.find_words_batch([text for text, _ in lines], longest=True)
+    readings = {}
+    runs = []
+    for (text, offset), found in zip(lines, matches):
+        if not found:
+            continue
+        # Vertical lines run down the page, their readings go to the right
+        first, last = layout.chars[offset], layout.chars[offset + len(text) - 1]
+        vertical = abs(last[1] - first[1]) > abs(last[0] - first[0])
+        for start, end, base in found:
+            surface = text[start:end]
+            kanji = [i for i, c in enumerate(surface) if is_kanji(c)]
+            if not kanji:
+                continue
+            if (surface, base) not in readings:
+                readings[surface, base] = word_reading(dictionary, surface, base)
+            reading = readings[surface, base]
+            if reading:
+                rect = layout.span_rects(offset + start + kanji[0], offset + start + kanji[-1] + 1)[0]
+                runs.append(rect + (reading, vertical))
+    return runs
+
+
+def glyph_runs(runs, scale):
+    """Lay out readings at a scale as (font, position, text) to draw with QPainter.drawStaticText."""
+    fonts = {}
+    glyphs = []
+    for x0, y0, x1, y1, reading, vertical in runs:
+        size = max(1, round(((x1 - x0) if vertical else (y1 - y0)) * RUBY_SIZE * scale))
+        font = fonts.get(size)
+        if font is None:
+            font = fonts[size] = QFont()
+            font.setPixelSize(size)
+        if vertical:
+            # One kana under the other, centred beside the kanji
+            step = min(size, (y1 - y0) * scale / len(reading))
+            top = (y0 + y1) / 2 * scale - step * len(reading) / 2
+            for i, kana in enumerate(reading):
+                text = QStaticText(kana)
+                text.prepare(font=font)
+                glyphs.append((font, QPointF(x1 * scale, top + i * step), text))
+        else:
+            text = QStaticText(reading)
+            text.prepare(font=font)
+            width, height = text.size().width(), text.size().height()
+            glyphs.append((font, QPointF((x0 + x1) / 2 * scale - width / 2, y0 * scale - height), text))
+    return glyphs
+
+
+class FuriganaAnnotator(QObject):
+    """Works out the readings of the kanji words on pages, in a background thread.
+
+    Pages are queued when they are painted, along with the next few, so
+    turning the page finds its readings done. Readings are kept per page
+    and laid out once per scale; painting only draws the prepared text.
+    """
+    _annotated = pyqtSignal(str, int, object)  # runs is None if the page couldn't be annotated
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.enabled = False
+        # Readings keyed by (document, page), glyph runs by (document, page, scale)
+        self.readings = PageCache(READING_CACHE_BUDGET)
+        self.glyphs = PageCache(GLYPH_CACHE_BUDGET)
+        self._queue = []  # (document, page) nearest first
+        self._running = None  # (document, page) the worker is on
+        self.error = None  # Why the last page that failed couldn't be annotated
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._annotated.connect(self._deliver)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.cancel()
+        self.update_labels()
+
+    def update_labels(self, page_number=None):
+        """Repaint the labels showing a page, or every label."""
+        reader = self.main_window
+        labels = list(reader.continuous_view.labels.values()) if reader.continuous else [reader.pdf_label]
+        for label in labels:
+            if page_number is None or label.page_number == page_number:
+                label.update()
+
+    def glyphs_for(self, label):
+        """Get the glyph runs to draw over a label, or None while its page is being annotated.
+
+        The page, and the ones after it, are queued if they haven't been annotated yet.
+        """
+        self.request(label.page_number)
+        return self.glyphs_at(label.page_number, label.scale)
+
+    def glyphs_at(self, page_number, scale):
+        """Get the glyph runs of an annotated page at a scale, laying them out on first use."""
+        key = (self.main_window.doc_path, page_number, scale)
+        glyphs = self.glyphs.get(key)
+        if glyphs is None:
+            runs = self.readings.get(key[:2])
+            if runs is None:
+                return None
+            glyphs = glyph_runs(runs, scale)
+            self.glyphs.put(key, glyphs, 300 * len(glyphs) + 64)
+        return glyphs
+
+    def request(self, page_number):
+        """Queue a page and the ones after it, ahead of anything queued before."""
+        reader = self.main_window
+        doc_path = reader.doc_path
+        pages = [(doc_path, number) for number in range(page_number, min(len(reader.doc), page_number + ANNOTATE_AHEAD + 1))
+                 if (doc_path, number) not in self.readings and (doc_path, number) != self._running]
+        if not pages:
+            return
+        with self._condition:
+            self._queue = pages + [job for job in self._queue if job not in pages]
+            del self._queue[MAX_QUEUED:]
+            self._condition.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='Furigana', daemon=True)
+            self._thread.start()
+
+    def cancel(self):
+        """Forget the queued pages."""
+        with self._condition:
+            self._queue.clear()
+
+    def invalidate(self, doc_path):
+        """Drop everything worked out for a document."""
+        self.cancel()
+        self.readings.invalidate(doc_path)
+        self.glyphs.invalidate(doc_path)
+
+    def stop(self):
+        """Stop the worker thread once it finishes the page it is on."""
+        with self._condition:
+            self._stop = True
+            self._queue.clear()
+            self._condition.notify()
+
+    def _run(self):
+        import fitz
+        doc = None
+        doc_opened = None
+        while True:
+            with self._condition:
+                while not self._queue and not self._stop:
+                    self._condition.wait()
+                if self._stop:
+                    break
+                self._running = self._queue.pop(0)
+            doc_path, page_number = self._running
+            try:
+                # A handle of our own, MuPDF documents can't be shared between threads
+                if doc_opened != doc_path:
+                    if doc is not None:
+                        doc.close()
+                        doc = doc_opened = None
+                    doc = fitz.open(doc_path)
+                    doc_opened = doc_path
+                with recorder.span('furigana'):
+                    runs = page_readings(self.main_window.dictionary, PageTextLayout(doc.load_page(page_number)))
+            except Exception as e:  # MuPDF's own errors don't derive from the built-in ones
+                self.error = e
+                runs = None
+            self._annotated.emit(doc_path, page_number, runs)
+            with self._condition:
+                self._running = None
+        if doc is not None:
+            doc.close()
+
+    def _deliver(self, doc_path, page_number, runs):
+        """Cache a page's readings on the GUI thread and show them."""
+        if doc_path != self.main_window.doc_path or runs is None:
+            # A page that failed isn't cached, so it is tried again the next time it is painted
+            return
+        self.readings.put((doc_path, page_number), runs, 100 * len(runs) + 64)
+        if self.enabled:
+            # Laid out now, at the scale the page will be shown at, so painting it only draws
+            self.glyphs_at(page_number, round(self.main_window.page_scale(page_number), 4))
+            self.update_labels(page_number)
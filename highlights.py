@@ -0,0 +1,94 @@
+import json
+import os
+
+# Highlights are written out once none has been added for this long
+SAVE_DELAY_MS = 2000
+
+
+def add_highlight(page, rect):
+    """Add a yellow highlight annotation over a rectangle of a page."""
+    import fitz
+    annot = page.add_highlight_annot(rect)
+    annot.set_colors(stroke=fitz.utils.getColor('yellow'))
+    annot.update()
+    return annot
+
+
+def sidecar_path(pdf_path):
+    """Get the file that keeps a PDF's highlights when they can't go into the PDF itself."""
+    return pdf_path + '.highlights.json'
+
+
+def read_sidecar(pdf_path):
+    """Get the (page number, rect) of every highlight kept next to a PDF."""
+    try:
+        with open(sidecar_path(pdf_path), encoding='utf-8') as f:
+            return [(item['page'], tuple(item['rect'])) for item in json.load(f)]
+    except FileNotFoundError:
+        return []
+
+
+def apply_sidecar(doc, pdf_path):
+    """Add the highlights kept next to a PDF to the open document, returning the pages they are on."""
+    import fitz
+    pages = set()
+    for page_number, rect in read_sidecar(pdf_path):
+        if 0 <= page_number < len(doc):
+            add_highlight(doc.load_page(page_number), fitz.Rect(rect))
+            pages.add(page_number)
+    return pages
+
+
+class HighlightSaver:
+    """Saves the highlights added to an open document, a batch at a time.
+
+    Highlights go into the PDF with an incremental save, which appends the
+    changed objects to the end of the file instead of rewriting all of it.
+    Each batch is saved through a handle opened for it: a second incremental
+    save from the same handle rewrites the start of the file and leaves it
+    needing repair. When saving isn't possible (a repaired or encrypted
+    document, a file we can't write) they are kept in a JSON file next to
+    the PDF instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+
+    def add(self, page_number, rect):
+        """Remember a highlight to save with the next batch."""
+        self.pending.append((page_number, tuple(rect)))
+
+    def flush(self):
+        """Save the pending highlights, returning 'pdf' or 'sidecar' for where they went, or None."""
+        if not self.pending:
+            return None
+        import fitz
+        try:
+            doc = fitz.open(self.path)
+            try:
+                if not doc.can_save_incrementally():
+                    raise ValueError("document can't be saved incrementally")
+                # The sidecar's highlights go in too, so it can be removed
+                apply_sidecar(doc, self.path)
+                for page_number, rect in self.pending:
+                    add_highlight(doc.load_page(page_number), fitz.Rect(rect))
+                doc.saveIncr()
+            finally:
+                doc.close()
+        except Exception:  # MuPDF's own errors don't derive from the built-in ones
+            self.write_sidecar(read_sidecar(self.path) + self.pending)
+            saved_to = 'sidecar'
+        else:
+            if os.path.exists(sidecar_path(self.path)):
+                os.remove(sidecar_path(self.path))
+            saved_to = 'pdf'
+        self.pending = []
+        return saved_to
+
+    def write_sidecar(self, highlights):
+        """Replace the sidecar file with a list of (page number, rect) highlights."""
+        path = sidecar_path(self.path)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump([{'page': page_number, 'rect': list(rect)} for page_number, rect in highlights], f)
+        os.replace(path + '.tmp', path)
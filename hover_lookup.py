@@ -0,0 +1,127 @@
+from collections import OrderedDict
+
+from PyQt5.QtWidgets import QApplication, QToolTip
+from PyQt5.QtCore import QObject, QTimer
+
+from perf import recorder
+
+# Longest run of text after the cursor that can make up a word
+MAX_MATCH_LENGTH = 16
+# Entries, and meanings of each, shown in the popup
+POPUP_ENTRIES = 3
+POPUP_MEANINGS = 3
+# Popup texts kept for words hovered recently
+POPUP_CACHE_SIZE = 256
+
+
+class HoverLookup(QObject):
+    """Looks up the word under the mouse and shows it in a tooltip.
+
+    Mouse moves only record the latest position; the lookup runs at most
+    once per display frame, on the newest position, and is skipped when
+    the cursor is still over the same character.
+    """
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.enabled = False
+        self.pending = None
+        self.last = None  # (label, page number, character index) looked up last
+        self.label = None  # Label the word under the cursor is marked on
+        self.page_number = None  # Page of the word under the cursor
+        self.rects = []  # Boxes of the word under the cursor, in PDF coordinates
+        self._popups = OrderedDict()
+
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 60
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(max(1, int(1000 / (refresh_rate or 60))))
+        self.timer.timeout.connect(self.look_up_pending)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.hide()
+
+    def hover(self, label, pos, global_pos):
+        """Note where the mouse is; the lookup happens on the next frame."""
+        self.pending = (label, pos, global_pos)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def look_up_pending(self):
+        if self.pending is None:
+            return
+        label, pos, global_pos = self.pending
+        self.pending = None
+        reader = self.main_window
+        if label.page_number is None or reader.doc is None or not reader.dictionary.is_ready() \
+                or reader.dictionary.error is not None:
+            return
+
+        with recorder.span('hover_lookup'):
+            layout = reader.text_layout(label.page_number)
+            index = layout.char_at(pos.x() / label.scale, pos.y() / label.scale)
+            if index is None:
+                self.hide()
+                return
+            if self.last == (label, label.page_number, index):
+                return
+            self.last = (label, label.page_number, index)
+
+            text = layout.text_from(index, MAX_MATCH_LENGTH)
+            match = reader.dictionary.longest_match(text)
+            if match is None:
+                self.hide()
+                return
+            # Looked up as written so the popup can say how an inflected word was read
+            end = match[0]
+            self.show_popup(label, global_pos, text[:end], layout.span_rects(index, index + end))
+
+    def popup_text(self, word):
+        """Get the short definition shown in the popup, from the cache if the word was hovered recently."""
+        text = self._popups.get(word)
+        if text is not None:
+            self._popups.move_to_end(word)
+            return text
+
+        lines = []
+        for base, reasons, entries in self.main_window.dictionary.lookup(word)[:POPUP_ENTRIES]:
+            if reasons:
+                lines.append(f"{word} → {base} ({', '.join(reasons)})")
+            for entry in entries[:POPUP_ENTRIES]:
+                lines.append(f"{entry.word} 【{entry.reading}】")
+                lines.append('; '.join(entry.meaning[:POPUP_MEANINGS]))
+        text = '\n'.join(lines)
+        self._popups[word] = text
+        if len(self._popups) > POPUP_CACHE_SIZE:
+            self._popups.popitem(last=False)
+        return text
+
+    def show_popup(self, label, global_pos, word, rects):
+        text = self.popup_text(word)
+        if not text:
+            self.hide()
+            return
+        previous = self.label
+        self.label = label
+        self.page_number = label.page_number
+        self.rects = rects
+        QToolTip.showText(global_pos, text, label)
+        if previous is not None and previous is not label:
+            previous.update()
+        label.update()
+
+    def hide(self):
+        """Close the popup and unmark the word."""
+        label = self.label
+        self.last = None
+        self.pending = None
+        if label is not None:
+            self.label = None
+            self.rects = []
+            self.page_number = None
+            label.update()
+        QToolTip.hideText()
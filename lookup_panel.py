@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+from PyQt5.QtWidgets import (QApplication, QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
+                             QListWidget, QListView, QTextEdit, QPushButton, QSplitter)
+from PyQt5.QtGui import QFont, QTextCursor
+from PyQt5.QtCore import Qt
+
+# Formatted definitions kept for words looked up recently
+DEFINITION_CACHE_SIZE = 512
+# Entries shown at first, and added each time "Show More" is pressed
+ENTRIES_PER_BATCH = 20
+
+
+def format_entry(entry):
+    """Format a dictionary entry as plain text."""
+    lines = [f"Word: {entry.word}", f"Reading: {entry.reading}"]
+    other_forms = [form for form in entry.kanji + entry.readings if form not in (entry.word, entry.reading)]
+    if other_forms:
+        lines.append(f"Other Forms: {', '.join(other_forms)}")
+    lines.append(f"Tags: {', '.join(entry.tags)}\n")
+
+    if entry.meaning:
+        lines.append("Meanings:")
+        lines.extend(f"- {meaning}" for meaning in entry.meaning)
+    else:
+        lines.append("Meanings: None")
+
+    if entry.notes:
+        lines.append("Other Info:")
+        lines.extend(f"- {note}" for note in entry.notes)
+    lines.append("\n---\n")
+    return '\n'.join(lines)
+
+
+def format_lookups(word, lookups):
+    """Format the results of JMDict.lookup as one block of text per entry."""
+    blocks = []
+    for base, reasons, entries in lookups:
+        for number, entry in enumerate(entries):
+            block = format_entry(entry)
+            if reasons and number == 0:
+                block = f"{word} → {base} ({', '.join(reasons)})\n\n{block}"
+            blocks.append(block)
+    return blocks
+
+
+class LookupPanel(QDockWidget):
+    """Dockable panel listing the words of a selection and the definition of the chosen one.
+
+    It is created once and reused for every lookup. Definitions are
+    formatted once per word and kept in an LRU, and long ones are shown
+    ENTRIES_PER_BATCH entries at a time.
+    """
+
+    def __init__(self, main_window):
+        super().__init__("Dictionary", main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.setObjectName("LookupPanel")
+        self.selected_text = ''
+        self.word = None
+        self.blocks = []
+        self.shown_blocks = 0
+        self._definitions = OrderedDict()
+
+        self.selection_label = QLabel()
+        self.selection_label.setWordWrap(True)
+
+        self.word_list = QListWidget()
+        # Long lists are laid out a batch at a time instead of all at once
+        self.word_list.setUniformItemSizes(True)
+        self.word_list.setLayoutMode(QListView.Batched)
+        font = QFont()
+        font.setPointSize(20)
+        self.word_list.setFont(font)
+        self.word_list.currentTextChanged.connect(self.show_definition)
+
+        self.definition = QTextEdit()
+        self.definition.setReadOnly(True)
+        font = QFont()
+        font.setPointSize(16)
+        self.definition.setFont(font)
+
+        self.more_button = QPushButton("Show More")
+        self.more_button.clicked.connect(self.show_more)
+        self.more_button.hide()
+
+        copy_selection_button = QPushButton("Copy Selection")
+        copy_selection_button.clicked.connect(lambda: self.copy(self.selected_text))
+        copy_word_button = QPushButton("Copy Word")
+        copy_word_button.clicked.connect(lambda: self.copy(self.word))
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.word_list)
+        definition_widget = QWidget()
+        definition_layout = QVBoxLayout()
+        definition_layout.setContentsMargins(0, 0, 0, 0)
+        definition_layout.addWidget(self.definition)
+        definition_layout.addWidget(self.more_button)
+        definition_widget.setLayout(definition_layout)
+        splitter.addWidget(definition_widget)
+        splitter.setStretchFactor(1, 2)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(copy_selection_button)
+        button_layout.addWidget(copy_word_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.selection_label)
+        layout.addWidget(splitter)
+        layout.addLayout(button_layout)
+        widget = QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+    def show_words(self, words, selected_text):
+        """List the words of a selection and show the definition of the first one."""
+        self.selected_text = selected_text
+        self.selection_label.setText(selected_text)
+        self.word_list.clear()
+        self.word_list.addItems(words)
+        self.show()
+        self.raise_()
+        if words:
+            self.word_list.setCurrentRow(0)
+
+    def definition_blocks(self, word):
+        """Get the formatted definition of a word, from the cache if it was looked up recently."""
+        blocks = self._definitions.get(word)
+        if blocks is None:
+            blocks = format_lookups(word, self.main_window.dictionary.lookup(word))
+            self._definitions[word] = blocks
+            if len(self._definitions) > DEFINITION_CACHE_SIZE:
+                self._definitions.popitem(last=False)
+        else:
+            self._definitions.move_to_end(word)
+        return blocks
+
+    def show_definition(self, word):
+        """Show the definition of a word, the first batch of entries of it at least."""
+        if not word:
+            return
+        self.word = word
+        self.blocks = self.definition_blocks(word)
+        self.shown_blocks = min(len(self.blocks), ENTRIES_PER_BATCH)
+        self.definition.setPlainText(''.join(self.blocks[:self.shown_blocks]) if self.blocks else "Word not found.")
+        self.more_button.setVisible(self.shown_blocks < len(self.blocks))
+        self.show()
+
+    def show_more(self):
+        """Add the next batch of entries to the definition shown."""
+        end = min(len(self.blocks), self.shown_blocks + ENTRIES_PER_BATCH)
+        cursor = self.definition.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(''.join(self.blocks[self.shown_blocks:end]))
+        self.shown_blocks = end
+        self.more_button.setVisible(self.shown_blocks < len(self.blocks))
+
+    def copy(self, text):
+        if text:
+            QApplication.clipboard().setText(text)
+            self.main_window.statusBar().showMessage(f"Copied '{text}' to the clipboard", 3000)
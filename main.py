@@ -1,13 +1,31 @@
 import sys
+import time
+
+started = time.perf_counter()
+
+import argparse
 from PyQt5.QtWidgets import QApplication
 from pdf_reader import PDFReader
-from menu import Menu
+from startup import StartupTimer
 
 sys.dont_write_bytecode = True
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    reader = PDFReader()
+    parser = argparse.ArgumentParser(description="PDF reader with a Japanese dictionary.")
+    parser.add_argument('pdf', nargs='?', help="PDF to open instead of asking for one")
+    parser.add_argument('--startup-timing', action='store_true', help="report how long startup takes")
+    args, qt_args = parser.parse_known_args()
+
+    startup_timer = None
+    if args.startup_timing:
+        startup_timer = StartupTimer(started)
+        startup_timer.milestone('imports')
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    reader = PDFReader(args.pdf, startup_timer)
+    if startup_timer is not None:
+        startup_timer.watch(reader)
+        startup_timer.milestone('window shown')
 
     reader.show()
     sys.exit(app.exec_())
@@ -19,6 +19,27 @@ class Menu:
         open_pdf_action.setShortcut("Ctrl+O")
         menuFile.addAction(open_pdf_action)
 
+        # Close Document
+        close_action = QAction("Close Document", self.parent)
+        close_action.setStatusTip("Close the document being read")
+        close_action.setShortcut("Ctrl+W")
+        close_action.triggered.connect(self.parent.close_current_document)
+        menuFile.addAction(close_action)
+
+        # Search Document
+        search_action = QAction("Search Document", self.parent)
+        search_action.setStatusTip("Search the text of the open PDF")
+        search_action.setShortcut("Ctrl+F")
+        search_action.triggered.connect(self.parent.open_search)
+        menuFile.addAction(search_action)
+
+        # Notes
+        notes_action = QAction("Notes...", self.parent)
+        notes_action.setStatusTip("Search the highlights and notes of every book")
+        notes_action.setShortcut("Ctrl+Shift+N")
+        notes_action.triggered.connect(self.parent.open_notes)
+        menuFile.addAction(notes_action)
+
         # View Menu
         menuView = menubar.addMenu('View')
 
@@ -36,6 +57,50 @@ class Menu:
         zoom_out_action.triggered.connect(self.parent.zoom_out)
         menuView.addAction(zoom_out_action)
 
+        # Continuous Scroll
+        continuous_action = QAction("Continuous Scroll", self.parent)
+        continuous_action.setStatusTip("Scroll through all pages instead of one page at a time")
+        continuous_action.setShortcut("Ctrl+L")
+        continuous_action.setCheckable(True)
+        continuous_action.toggled.connect(self.parent.set_continuous)
+        menuView.addAction(continuous_action)
+
+        # Hover Lookup
+        hover_lookup_action = QAction("Hover Lookup", self.parent)
+        hover_lookup_action.setStatusTip("Look up the word under the mouse")
+        hover_lookup_action.setShortcut("Ctrl+H")
+        hover_lookup_action.setCheckable(True)
+        hover_lookup_action.toggled.connect(self.parent.hover_lookup.set_enabled)
+        menuView.addAction(hover_lookup_action)
+
+        # Furigana
+        furigana_action = QAction("Furigana", self.parent)
+        furigana_action.setStatusTip("Show the reading over every kanji word on the page")
+        furigana_action.setShortcut("Ctrl+R")
+        furigana_action.setCheckable(True)
+        furigana_action.toggled.connect(self.parent.furigana.set_enabled)
+        menuView.addAction(furigana_action)
+
+        # Dictionary Panel
+        lookup_panel_action = self.parent.lookup_panel.toggleViewAction()
+        lookup_panel_action.setStatusTip("Show or hide the dictionary panel")
+        lookup_panel_action.setShortcut("Ctrl+D")
+        menuView.addAction(lookup_panel_action)
+
+        # Performance Overlay
+        perf_overlay_action = QAction("Performance Overlay", self.parent)
+        perf_overlay_action.setStatusTip("Show render and lookup timings")
+        perf_overlay_action.setShortcut("Ctrl+Shift+P")
+        perf_overlay_action.setCheckable(True)
+        perf_overlay_action.toggled.connect(self.parent.perf_overlay.set_visible)
+        menuView.addAction(perf_overlay_action)
+
+        # Export Performance Trace
+        export_trace_action = QAction("Export Performance Trace...", self.parent)
+        export_trace_action.setStatusTip("Save the recorded timings as a Chrome trace file")
+        export_trace_action.triggered.connect(self.parent.export_trace)
+        menuView.addAction(export_trace_action)
+
         # Previous Page
         page_prev_action = QAction("Previous Page", self.parent)
         page_prev_action.setStatusTip("Move to previous page")
@@ -0,0 +1,87 @@
+import os
+import time
+
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QLabel,
+                             QPushButton, QInputDialog)
+from PyQt5.QtCore import Qt, QTimer
+
+# How long typing has to pause before the query is searched
+SEARCH_DELAY_MS = 150
+
+
+def describe(highlight):
+    """Get the line a highlight is listed as."""
+    line = f"{os.path.basename(highlight.doc_path or '')} p.{highlight.page + 1}: {highlight.text}"
+    if highlight.word:
+        line += f" [{highlight.word}]"
+    if highlight.note:
+        line += f" — {highlight.note}"
+    return line.replace('\n', ' ')
+
+
+class NotesBrowser(QDialog):
+    """Searches the highlights and notes of every book by their text, note or word."""
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.setWindowTitle("Notes")
+        self.setGeometry(200, 200, 560, 600)
+
+        layout = QVBoxLayout()
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Search highlights, notes and words...")
+        layout.addWidget(self.query_edit)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.results = QListWidget()
+        # Long result lists are laid out a batch at a time
+        self.results.setUniformItemSizes(True)
+        layout.addWidget(self.results)
+
+        button_layout = QHBoxLayout()
+        edit_button = QPushButton("Edit Note")
+        edit_button.clicked.connect(self.edit_note)
+        button_layout.addWidget(edit_button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.query_edit.textChanged.connect(self.search_timer.start)
+        self.query_edit.returnPressed.connect(self.run_search)
+        self.results.itemActivated.connect(self.highlight_selected)
+
+    def run_search(self):
+        """List the highlights matching the query, newest first."""
+        self.search_timer.stop()
+        store = self.main_window.notes_store
+        started = time.perf_counter()
+        highlights = store.search(self.query_edit.text())
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.results.clear()
+        for highlight in highlights:
+            item = QListWidgetItem(describe(highlight))
+            item.setData(Qt.UserRole, highlight)
+            self.results.addItem(item)
+        if store.error is not None:
+            self.status_label.setText(f"Notes unavailable: {store.error}")
+        else:
+            self.status_label.setText(f"{len(highlights)} highlights ({elapsed:.1f} ms)")
+
+    def highlight_selected(self, item):
+        self.main_window.show_highlight(item.data(Qt.UserRole))
+
+    def edit_note(self):
+        item = self.results.currentItem()
+        if item is None:
+            return
+        highlight = item.data(Qt.UserRole)
+        note, ok = QInputDialog.getMultiLineText(self, "Edit Note", highlight.text, highlight.note or '')
+        if ok:
+            self.main_window.set_note(highlight, note)
+            item.setText(describe(highlight))
@@ -0,0 +1,257 @@
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Bump whenever the layout of the store changes
+NOTES_VERSION = 1
+
+# Where highlights and their notes are kept, for every book in one place
+NOTES_FILE = os.path.join(os.path.expanduser('~'), '.jpdf', 'notes.sqlite')
+
+# Most results a query returns
+MAX_RESULTS = 500
+
+# Below this many characters the trigram index can't be used and text is scanned instead
+MIN_FTS_QUERY = 3
+
+
+def document_hash(path):
+    """Identify a PDF across renames, copies and highlights being saved into it.
+
+    The PDF as it was first written is hashed, trailer and ID included: up to
+    its first end-of-file marker, or for a linearized file the length its
+    linearization dictionary gives, as the first marker there only ends the
+    first page. The incremental saves highlights go in with append after
+    that. The ID of the current trailer can't be used on its own, a PDF
+    without one gets one when first saved. Hashing the whole revision reads
+    the file once per book opened; any less lets two editions that start
+    alike share their notes.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        head = f.read(1024)
+        linearized = re.search(rb'/Linearized\s.*?/L\s+(\d+)', head, re.S)
+        if linearized:
+            f.seek(0)
+            remaining = int(linearized.group(1))
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            return digest.hexdigest()
+        tail = b''
+        chunk = head
+        while chunk:
+            # The marker may straddle two chunks
+            data = tail + chunk
+            end = data.find(b'%%EOF')
+            if end != -1:
+                digest.update(data[:end])
+                break
+            digest.update(data[:-4])
+            tail = data[-4:]
+            chunk = f.read(1 << 20)
+        else:
+            digest.update(tail)
+    return digest.hexdigest()
+
+
+class Highlight:
+    """A highlight as stored, with its note."""
+    __slots__ = ('id', 'doc_hash', 'doc_path', 'page', 'rect', 'text', 'note', 'word', 'created')
+
+    def __init__(self, id, doc_hash, doc_path, page, rect, text, note, word, created):
+        self.id = id
+        self.doc_hash = doc_hash
+        self.doc_path = doc_path
+        self.page = page
+        self.rect = rect  # (x0, y0, x1, y1) in PDF coordinates
+        self.text = text
+        self.note = note
+        self.word = word  # Dictionary form of the word the highlight starts with
+        self.created = created
+
+    def __repr__(self):
+        return f"Highlight({self.id}, {self.doc_path!r}, {self.page}, {self.text!r})"
+
+
+class NotesStore:
+    """Highlights and their notes for every book, in one SQLite file with a full-text index.
+
+    Writes are queued and committed by a background thread, each batch in
+    one transaction; reads use connections of their own and never wait on
+    the writer. Text and notes are indexed by trigram, so any part of them
+    can be searched without splitting Japanese into words.
+    """
+
+    def __init__(self, notes_file=NOTES_FILE):
+        self.notes_file = notes_file
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self.opened = threading.Event()
+        self.error = None  # Why the store couldn't be opened
+        self._thread = None
+
+    def start(self):
+        """Open the store, creating it if needed, in the writer thread."""
+        self._thread = threading.Thread(target=self._run, name='Notes writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write what is queued, then stop the writer thread."""
+        if self._thread is not None:
+            self._writes.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            conn = self.open_store()
+        except sqlite3.Error as e:
+            self.error = e
+            self.opened.set()
+            return
+        self.opened.set()
+        while True:
+            batch = [self._writes.get()]
+            # Everything queued meanwhile goes into the same transaction
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            committed = []
+            try:
+                with conn:
+                    for write in batch:
+                        if write is not None:
+                            sql, params, *callback = write
+                            cursor = conn.execute(sql, params)
+                            if callback:
+                                committed.append((callback[0], cursor.lastrowid))
+            except sqlite3.Error as e:
+                # Only this batch is lost; the store stays usable for the writes after it
+                for write in batch:
+                    if write is not None and len(write) > 2:
+                        write[2](None, e)
+            else:
+                for callback, rowid in committed:
+                    callback(rowid, None)
+            if stopping:
+                conn.close()
+                return
+
+    def open_store(self):
+        """Open the store for writing, creating its tables the first time."""
+        os.makedirs(os.path.dirname(self.notes_file) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.notes_file)
+        # Let the notes browser read while highlights are being written
+        conn.execute('PRAGMA journal_mode=WAL')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == NOTES_VERSION:
+            return conn
+        with conn:
+            conn.execute('CREATE TABLE highlights ('
+                         'id INTEGER PRIMARY KEY, doc_hash TEXT NOT NULL, doc_path TEXT, page INTEGER NOT NULL, '
+                         'x0 REAL, y0 REAL, x1 REAL, y1 REAL, text TEXT, note TEXT, word TEXT, created REAL)')
+            conn.execute('CREATE INDEX highlights_page ON highlights (doc_hash, page)')
+            conn.execute('CREATE INDEX highlights_word ON highlights (word)')
+            conn.execute("CREATE VIRTUAL TABLE highlights_fts USING fts5("
+                         "text, note, content='highlights', content_rowid='id', tokenize='trigram')")
+            # Keep the full-text index in step with the table
+            conn.execute('CREATE TRIGGER highlights_insert AFTER INSERT ON highlights BEGIN '
+                         'INSERT INTO highlights_fts (rowid, text, note) VALUES (new.id, new.text, new.note); END')
+            conn.execute('CREATE TRIGGER highlights_delete AFTER DELETE ON highlights BEGIN '
+                         "INSERT INTO highlights_fts (highlights_fts, rowid, text, note) "
+                         "VALUES ('delete', old.id, old.text, old.note); END")
+            conn.execute('CREATE TRIGGER highlights_update AFTER UPDATE ON highlights BEGIN '
+                         "INSERT INTO highlights_fts (highlights_fts, rowid, text, note) "
+                         "VALUES ('delete', old.id, old.text, old.note); "
+                         'INSERT INTO highlights_fts (rowid, text, note) VALUES (new.id, new.text, new.note); END')
+            conn.execute(f'PRAGMA user_version = {NOTES_VERSION}')
+        return conn
+
+    def connection(self):
+        """Get this thread's read-only connection to the store."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(self.notes_file).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def is_ready(self):
+        return self.opened.is_set() and self.error is None
+
+    # Writing
+
+    def add(self, doc_hash, doc_path, page_number, rect, text, note='', word=None, written_callback=None):
+        """Queue a new highlight to be written, returning it as it will be stored.
+
+        Its id is None until it is committed. Then the writer thread fills
+        it in and calls written_callback with the highlight and None, or with
+        the highlight and the error if it couldn't be written.
+        """
+        created = time.time()
+        highlight = Highlight(None, doc_hash, doc_path, page_number, tuple(rect), text, note, word, created)
+
+        def committed(rowid, error):
+            if error is None:
+                highlight.id = rowid
+            if written_callback:
+                written_callback(highlight, error)
+
+        self._writes.put(('INSERT INTO highlights (doc_hash, doc_path, page, x0, y0, x1, y1, text, note, word, created) '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (doc_hash, doc_path, page_number, *rect, text, note, word, created), committed))
+        return highlight
+
+    def set_note(self, highlight_id, note):
+        """Queue a change to a highlight's note."""
+        self._writes.put(('UPDATE highlights SET note = ? WHERE id = ?', (note, highlight_id)))
+
+    def delete(self, highlight_id):
+        """Queue a highlight to be removed from the store."""
+        self._writes.put(('DELETE FROM highlights WHERE id = ?', (highlight_id,)))
+
+    # Reading
+
+    def query(self, sql, params=()):
+        if not self.is_ready():
+            return []
+        return [Highlight(row[0], row[1], row[2], row[3], tuple(row[4:8]), *row[8:])
+                for row in self.connection().execute(sql, params)]
+
+    def page_highlights(self, doc_hash, page_number):
+        """Get the highlights on one page of a document."""
+        return self.query('SELECT id, doc_hash, doc_path, page, x0, y0, x1, y1, text, note, word, created '
+                          'FROM highlights WHERE doc_hash = ? AND page = ? ORDER BY id', (doc_hash, page_number))
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Find highlights whose text or note contains the query, or whose word is it, newest first.
+
+        An empty query gets the newest highlights.
+        """
+        query = query.strip()
+        columns = 'h.id, h.doc_hash, h.doc_path, h.page, h.x0, h.y0, h.x1, h.y1, h.text, h.note, h.word, h.created'
+        if not query:
+            return self.query(f'SELECT {columns} FROM highlights h ORDER BY h.id DESC LIMIT ?', (limit,))
+        if len(query) >= MIN_FTS_QUERY:
+            phrase = '"' + query.replace('"', '""') + '"'
+            return self.query(
+                f'SELECT {columns} FROM highlights h WHERE h.id IN '
+                '(SELECT rowid FROM highlights_fts WHERE highlights_fts MATCH ? UNION SELECT id FROM highlights WHERE word = ?) '
+                'ORDER BY h.id DESC LIMIT ?', (phrase, query, limit))
+        # Too short for trigrams; one or two kanji are a common query, and a scan of the text is still quick
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self.query(
+            f"SELECT {columns} FROM highlights h WHERE h.word = ? OR h.text LIKE ? ESCAPE '\\' OR h.note LIKE ? ESCAPE '\\' "
+            'ORDER BY h.id DESC LIMIT ?', (query, pattern, pattern, limit))
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+
+
+class PageCache:
+    """LRU cache of rendered pages, bounded by the bytes the renders take up.
+
+    Keys are (document, page number, ...) tuples, so everything rendered for
+    a page can be dropped at once when the page changes.
+    """
+
+    def __init__(self, budget=256 * 1024 * 1024):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.manager = None  # CacheManager sharing a budget between this cache and others
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """Get a cached render and mark it as recently used, or None."""
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size):
+        """Cache a render of the given size in bytes, evicting the least recently used ones."""
+        self.remove(key)
+        if size > self.budget:
+            return
+        self._items[key] = (value, size)
+        self.size += size
+        if self.manager is not None:
+            self.manager.trim()
+            return
+        while self.size > self.budget:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.size -= evicted_size
+
+    def remove(self, key):
+        """Drop a single render, returning the bytes freed."""
+        item = self._items.pop(key, None)
+        if item is None:
+            return 0
+        self.size -= item[1]
+        return item[1]
+
+    def remove_oldest(self):
+        """Drop the least recently used render, returning the bytes freed."""
+        if not self._items:
+            return 0
+        return self.remove(next(iter(self._items)))
+
+    def keys(self, doc, page_number=None):
+        """Get the keys of every render of a page, or of the whole document if no page is given."""
+        return [key for key in self._items
+                if key[0] == doc and (page_number is None or key[1] == page_number)]
+
+    def invalidate(self, doc, page_number=None):
+        """Drop every render of a page, or of the whole document if no page is given."""
+        for key in self.keys(doc, page_number):
+            self.remove(key)
+
+    def clear(self):
+        """Drop everything."""
+        self._items.clear()
+        self.size = 0
+
+    def stats(self):
+        """Get the hit/miss counters and memory use."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._items),
+            'bytes': self.size,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CacheManager:
+    """Holds the page caches of every open document to one memory budget between them.
+
+    Each cache still keeps to its own budget as well. Whenever a cache or
+    all of them together go over, entries are dropped from the documents
+    used longest ago first; the active document only loses its least
+    recently used entries once nothing of the others is left.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.caches = []
+        self.documents = OrderedDict()  # Document paths, the active one last
+        self.evictions = 0
+
+    def register(self, cache):
+        """Put a cache under the shared budget."""
+        cache.manager = self
+        self.caches.append(cache)
+        return cache
+
+    def size(self):
+        return sum(cache.size for cache in self.caches)
+
+    def activate(self, doc):
+        """Mark a document as the one being read."""
+        self.documents[doc] = None
+        self.documents.move_to_end(doc)
+
+    def forget(self, doc):
+        """Drop everything cached for a document that was closed."""
+        self.documents.pop(doc, None)
+        for cache in self.caches:
+            cache.invalidate(doc)
+
+    def trim(self):
+        """Evict entries until every cache, and all of them together, are within budget."""
+        for cache in self.caches:
+            if cache.size > cache.budget:
+                self.evict(cache.size - cache.budget, [cache])
+        over = self.size() - self.budget
+        if over > 0:
+            self.evict(over, self.caches)
+
+    def evict(self, amount, caches):
+        """Free at least amount bytes from the given caches, inactive documents first."""
+        freed = 0
+        active = next(reversed(self.documents), None)
+        for doc in self.documents:
+            if doc == active:
+                break
+            for cache in caches:
+                for key in cache.keys(doc):
+                    freed += cache.remove(key)
+                    self.evictions += 1
+                    if freed >= amount:
+                        return
+        # Only the active document is left, so the least recently used entries of the biggest cache go
+        while freed < amount:
+            cache = max(caches, key=lambda cache: cache.size)
+            if not len(cache):
+                return
+            freed += cache.remove_oldest()
+            self.evictions += 1
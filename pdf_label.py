@@ -0,0 +1,174 @@
+from PyQt5.QtWidgets import QLabel, QToolTip
+from PyQt5.QtGui import QPainter, QColor, QPen, QBrush
+from PyQt5.QtCore import Qt, QEvent, QRect, QRectF, QSize
+
+from tiles import TILE_SIZE, tiles_in_rect
+
+
+class PDFLabel(QLabel):
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window  # Reference to PDFReader
+        self.page_number = None  # Page shown in this label
+        self.scale = 1  # Scale the page was rendered at
+        self.key = None  # Render cache key of the pixmap shown
+        self.tiled = False  # Drawn from cached tiles instead of one pixmap
+        self.content_size = QSize()
+        self.selection_start = None
+        self.selection_end = None
+        self.selection_rect = None
+        # Mouse moves without a button pressed drive the hover lookup
+        self.setMouseTracking(True)
+
+    def show_render(self, page_number, key, pixmap):
+        """Show a render of a page. The selection is kept in the label's own coordinates."""
+        self.page_number = page_number
+        self.scale = key[2]
+        self.key = key
+        self.tiled = False
+        self.setPixmap(pixmap)
+        self.set_content_size(pixmap.width(), pixmap.height())
+
+    def show_preview(self, pixmap, scale):
+        """Show a stand-in for a render at another scale until the real one is ready."""
+        self.scale = scale
+        self.key = None
+        self.tiled = False
+        self.setPixmap(pixmap)
+        self.set_content_size(pixmap.width(), pixmap.height())
+
+    def show_tiled(self, page_number, key, width, height):
+        """Show a page too big to render in one piece, painting whichever tiles are visible."""
+        self.page_number = page_number
+        self.scale = key[2]
+        self.key = key
+        self.tiled = True
+        self.clear()
+        self.set_content_size(width, height)
+        self.update()
+
+    def set_content_size(self, width, height):
+        """Size the label to the page it shows."""
+        self.content_size = QSize(width, height)
+        self.updateGeometry()
+        self.resize(width, height)
+
+    def sizeHint(self):
+        if self.content_size.isValid():
+            return self.content_size
+        return super().sizeHint()
+
+    def minimumSizeHint(self):
+        if self.content_size.isValid():
+            return self.content_size
+        return super().minimumSizeHint()
+
+    def release(self):
+        """Drop the pixmap so an off-screen label holds no memory."""
+        self.page_number = None
+        self.key = None
+        self.tiled = False
+        self.content_size = QSize()
+        self.clear()
+
+    def paint_tiles(self, painter, rect):
+        """Draw the cached tiles overlapping a rectangle and ask for the missing ones."""
+        painter.fillRect(rect, Qt.white)
+        page_cache = self.main_window.page_cache
+        for column, row in tiles_in_rect(rect.x(), rect.y(), rect.width(), rect.height(), self.width(), self.height()):
+            pixmap = page_cache.get(self.key + (column, row))
+            if pixmap is not None:
+                painter.drawPixmap(column * TILE_SIZE, row * TILE_SIZE, pixmap)
+        self.main_window.request_tiles(self)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.selection_start = event.pos()
+            self.update()
+
+    def mouseMoveEvent(self, event):
+        if self.selection_start:
+            self.selection_end = event.pos()
+            self.selection_rect = QRect(self.selection_start, self.selection_end).normalized()
+            self.main_window.preview_selection(self)
+            self.update()
+        elif self.main_window.hover_lookup.enabled:
+            self.main_window.hover_lookup.hover(self, event.pos(), event.globalPos())
+
+    def event(self, event):
+        # Hovering over a highlight with a note shows the note
+        if event.type() == QEvent.ToolTip:
+            note = self.main_window.note_at(self, event.pos())
+            if note:
+                QToolTip.showText(event.globalPos(), note, self)
+            elif not self.main_window.hover_lookup.rects:
+                QToolTip.hideText()
+            return True
+        return super().event(event)
+
+    def leaveEvent(self, event):
+        if self.main_window.hover_lookup.label is self:
+            self.main_window.hover_lookup.hide()
+        super().leaveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton and self.selection_rect:
+            self.selection_end = event.pos()
+            self.selection_rect = QRect(self.selection_start, self.selection_end).normalized()
+            self.main_window.active_label = self
+            selected_text = self.main_window.get_selected_text()
+            self.main_window.statusBar().clearMessage()
+            if selected_text:
+                self.main_window.context_menu.exec_(event.globalPos())
+            else:
+                self.main_window.show_message("No valid text selected.", "Selection Error")
+            # Clear the selection after using it
+            self.selection_start = None
+            self.selection_end = None
+            self.selection_rect = None
+            self.update()
+
+    def paint_rects(self, rects, color):
+        """Fill rectangles given in PDF coordinates of the page."""
+        painter = QPainter(self)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(color))
+        for x0, y0, x1, y1 in rects:
+            painter.drawRect(QRectF(x0 * self.scale, y0 * self.scale, (x1 - x0) * self.scale, (y1 - y0) * self.scale))
+        painter.end()
+
+    def paint_furigana(self):
+        """Draw the readings over the kanji of the page, once the page has been annotated."""
+        glyphs = self.main_window.furigana.glyphs_for(self)
+        if not glyphs:
+            return
+        painter = QPainter(self)
+        painter.setPen(QColor(200, 0, 0))
+        for font, position, text in glyphs:
+            painter.setFont(font)
+            painter.drawStaticText(position, text)
+        painter.end()
+
+    def paintEvent(self, event):
+        if self.tiled:
+            painter = QPainter(self)
+            self.paint_tiles(painter, event.rect())
+            painter.end()
+        else:
+            super().paintEvent(event)
+        hits = self.main_window.search_hits.get(self.page_number)
+        if hits:
+            self.paint_rects(hits, QColor(255, 140, 0, 90))
+        if self.main_window.furigana.enabled and self.page_number is not None:
+            self.paint_furigana()
+        hover_lookup = self.main_window.hover_lookup
+        if hover_lookup.rects and hover_lookup.label is self and hover_lookup.page_number == self.page_number:
+            self.paint_rects(hover_lookup.rects, QColor(0, 160, 80, 70))
+        if self.selection_rect:
+            painter = QPainter(self)
+            painter.setRenderHint(QPainter.Antialiasing)
+            br = QBrush(QColor(0, 0, 255, 50))
+            painter.setBrush(br)
+            painter.setPen(QPen(QColor(0, 0, 255), 1))
+            painter.drawRect(self.selection_rect)
+            painter.end()
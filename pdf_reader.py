@@ -1,14 +1,48 @@
-import fitz
-import pyautogui
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QScrollArea, QMenu, QFileDialog, QAction, QListWidget, QMessageBox, QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTextEdit, QWidget
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QColor, QPen, QFont, QBrush
-from PyQt5.QtCore import Qt, QRect, QPoint
-from dictionary import JMDict
+from PyQt5.QtWidgets import QMainWindow, QScrollArea, QMenu, QFileDialog, QAction, QMessageBox, QInputDialog, QTabBar, QVBoxLayout, QWidget
+from PyQt5.QtGui import QImage, QPixmap, QPainter
+from PyQt5.QtCore import Qt, QObject, QRect, QTimer, pyqtSignal
+from continuous_view import ContinuousView
+from dictionary_server import open_dictionary
+from documents import MAX_OPEN_DOCUMENTS, Document
+from furigana import FuriganaAnnotator
+from highlights import SAVE_DELAY_MS, add_highlight
+from hover_lookup import HoverLookup
+from lookup_panel import LookupPanel
 from menu import Menu
-import re
+from notes_browser import NotesBrowser
+from notes_store import NotesStore
+from pdf_label import PDFLabel
+from perf import recorder, timed
+from perf_overlay import PerfOverlay
+from page_cache import CacheManager, PageCache
+from prefetch import PagePrefetcher
+from rendering import DisplayListCache, rasterize
+from search_dialog import SearchDialog
+from search_index import SearchIndex
+from segmentation import clean_word, split_into_possible_words
+from text_layout import PageTextLayout
+from tiles import TILE_SIZE, needs_tiles, page_pixel_size, tile_clip, tiles_in_rect
+import math
+import os
+
+# Memory the caches of every open document may use together
+CACHE_BUDGET = 320 * 1024 * 1024
+# Memory the rendered page cache may use
+PAGE_CACHE_BUDGET = 256 * 1024 * 1024
+# Memory the text layouts of pages may use
+TEXT_CACHE_BUDGET = 32 * 1024 * 1024
+# Memory the highlights and notes of pages may use
+NOTES_CACHE_BUDGET = 4 * 1024 * 1024
+# How many pages either side of the current one to render ahead of time
+PREFETCH_DISTANCE = 2
+# Highest zoom level
+MAX_SCALE_MOD = 8
+# How long resizing or zooming has to pause before the page is rendered at full quality
+REFRESH_DELAY_MS = 150
 
 class PDFReader(QMainWindow):
-    def __init__(self):
+    def __init__(self, pdf_path=None, startup_timer=None):
+        """Show the window, then open pdf_path (or ask for a file) once the event loop runs."""
         super().__init__()
         self.scale_mod = 1
 
@@ -16,9 +50,36 @@ class PDFReader(QMainWindow):
         self.setGeometry(100, 100, 720, 720)
 
         self.scroll_area = QScrollArea()
-        self.setCentralWidget(self.scroll_area)
+        # Keep the viewport width stable, otherwise the scale (and every cached render) changes
+        # whenever the scrollbar comes and goes
+        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+
+        # One tab per open document, shown once there are two
+        self.tab_bar = QTabBar()
+        self.tab_bar.setTabsClosable(True)
+        self.tab_bar.setDocumentMode(True)
+        self.tab_bar.setExpanding(False)
+        self.tab_bar.setAutoHide(True)
+        self.tab_bar.currentChanged.connect(self.tab_changed)
+        self.tab_bar.tabCloseRequested.connect(self.close_document)
+
+        central_layout = QVBoxLayout()
+        central_layout.setContentsMargins(0, 0, 0, 0)
+        central_layout.setSpacing(0)
+        central_layout.addWidget(self.tab_bar)
+        central_layout.addWidget(self.scroll_area)
+        central_widget = QWidget()
+        central_widget.setLayout(central_layout)
+        self.setCentralWidget(central_widget)
+
+        # Looks up the word under the mouse when enabled from the View menu
+        self.hover_lookup = HoverLookup(self)
+        # Readings drawn over the kanji of the page, also enabled from the View menu
+        self.furigana = FuriganaAnnotator(self)
 
         self.pdf_label = PDFLabel(self)
+        # The label the current selection was made on
+        self.active_label = self.pdf_label
 
         self.layout = QVBoxLayout()
         self.layout.setAlignment(Qt.AlignCenter)
@@ -30,123 +91,614 @@ class PDFReader(QMainWindow):
 
         self.layout.addWidget(self.pdf_label)
         self.scroll_area.setWidget(self.container)
+        self.scroll_area.setWidgetResizable(True)
+
+        # Continuous scroll mode swaps the single page container for this view
+        self.continuous = False
+        self.continuous_view = ContinuousView(self)
 
-        self.dictionary = JMDict('./JMdict.xml')
+        # The dictionary loads in the background once the first page is up, see start_up.
+        # A running dictionary server is used instead of loading a copy here.
+        self.dictionary = open_dictionary('./JMdict.xml')
+        self.dictionary_signals = DictionarySignals()
+        self.dictionary_signals.progress.connect(self.dictionary_progress)
+        self.dictionary_signals.finished.connect(self.dictionary_finished)
 
         self.context_menu = QMenu(self)
         self.search_action = QAction("Search in Dictionary", self)
         self.highlight_action = QAction("Highlight Selection", self)
+        self.highlight_note_action = QAction("Highlight with Note...", self)
 
         self.search_action.triggered.connect(self.search_selected_text)
-        self.highlight_action.triggered.connect(self.highlight_selection)
+        self.highlight_action.triggered.connect(lambda: self.highlight_selection())
+        self.highlight_note_action.triggered.connect(self.highlight_with_note)
 
         self.context_menu.addAction(self.search_action)
         self.context_menu.addAction(self.highlight_action)
+        self.context_menu.addAction(self.highlight_note_action)
 
         self.selection_rect = None
-        self.doc = None
+        # Open documents by path, and the one being read; see the properties below for its state
+        self.documents = {}
+        self.document = None
         self.scale_factor = 1  # Initialize scale_factor
 
+        # One memory budget for the caches of every open document, the ones not being read give way first
+        self.cache_manager = CacheManager(CACHE_BUDGET)
+        # Rendered pages, keyed by (document, page, scale, annotation revision)
+        self.page_cache = self.cache_manager.register(PageCache(PAGE_CACHE_BUDGET))
+        self.prefetcher = PagePrefetcher(parent=self)
+        self.prefetcher.page_rendered.connect(self.page_prefetched)
+        # Parsed page contents, so re-rendering at another scale skips the parsing
+        self.display_lists = DisplayListCache()
+        # Character boxes of pages, keyed by (document, page), for selection hit-testing
+        self.text_layouts = self.cache_manager.register(PageCache(TEXT_CACHE_BUDGET))
+        self.cache_manager.register(self.furigana.readings)
+        self.cache_manager.register(self.furigana.glyphs)
+
+        # Bursts of resize events and zoom steps are coalesced into one render
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(REFRESH_DELAY_MS)
+        self.refresh_timer.timeout.connect(self.refresh_view)
+
+        # Highlights with their text and notes, for every book; a page's are read when it is first asked about
+        self.notes_store = NotesStore()
+        self.page_notes = self.cache_manager.register(PageCache(NOTES_CACHE_BUDGET))
+        self.notes_signals = NotesSignals()
+        self.notes_signals.written.connect(self.highlight_written)
+        self.notes_browser = None
+
+        # New highlights are saved in batches rather than after each one
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DELAY_MS)
+        self.save_timer.timeout.connect(self.save_highlights)
+
+        # Full-text index of the open document, built in the background
+        self.search_index = None
+        self.search_dialog = None
+        self.search_hits = {}
+        self.search_signals = SearchSignals()
+        self.search_signals.page_indexed.connect(self.page_indexed)
+        self.search_signals.finished.connect(self.indexing_finished)
+
+        # Word lists and definitions, docked beside the page and reused for every lookup
+        self.lookup_panel = LookupPanel(self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.lookup_panel)
+        self.lookup_panel.hide()
+
+        # Timings and counters, shown from the View menu
+        self.perf_overlay = PerfOverlay(self)
+
         self.show()
 
         self.menu = Menu(self)
         self.menu.init_menu()
 
-        self.load_pdf()
+        # Reports startup milestones when main.py is run with --startup-timing
+        self.startup_timer = startup_timer
+        # Opening the document (and importing MuPDF) waits until the window has painted, see paintEvent
+        self.startup_path = pdf_path
+        self.started_up = False
 
-    def highlight_selection(self):
-        if not self.pdf_label.selection_rect:
-            return
+    # The document being read
+
+    @property
+    def doc(self):
+        """MuPDF handle of the document being read, or None."""
+        return self.document.open() if self.document is not None else None
+
+    @property
+    def doc_path(self):
+        return self.document.path if self.document is not None else None
+
+    @property
+    def page_rects(self):
+        return self.document.page_rects if self.document is not None else []
 
-        page = self.doc.load_page(self.current_page)
-        rect = self.pdf_label.selection_rect
+    @property
+    def annot_revisions(self):
+        """Revision of each page whose annotations changed, for telling its renders apart."""
+        return self.document.annot_revisions if self.document is not None else {}
 
-        # Map the selection rectangle coordinates to PDF coordinates
-        x0_pixmap = rect.left()
-        y0_pixmap = rect.top()
-        x1_pixmap = rect.right()
-        y1_pixmap = rect.bottom()
+    @property
+    def unsaved_pages(self):
+        """Pages with highlights that are only in our handle, which the render workers can't draw."""
+        return self.document.unsaved_pages if self.document is not None else set()
+
+    @property
+    def highlight_saver(self):
+        return self.document.highlight_saver if self.document is not None else None
+
+    @property
+    def current_page(self):
+        return self.document.current_page if self.document is not None else 0
+
+    @current_page.setter
+    def current_page(self, page_number):
+        if self.document is not None:
+            self.document.current_page = page_number
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.started_up:
+            self.started_up = True
+            QTimer.singleShot(0, lambda: self.start_up(self.startup_path))
+
+    def start_up(self, pdf_path):
+        """Open the first document and start loading the dictionary."""
+        self.notes_store.start()
+        if pdf_path:
+            self.open_pdf(pdf_path)
+            self.start_dictionary()
+        else:
+            # The dictionary can load while a file is being picked
+            self.start_dictionary()
+            self.load_pdf()
+
+    def start_dictionary(self):
+        """Load the dictionary in the background so the window stays usable."""
+        self.dictionary.start_loading(
+            progress_callback=lambda fraction: self.dictionary_signals.progress.emit(int(fraction * 100)),
+            done_callback=lambda error: self.dictionary_signals.finished.emit(str(error) if error else ''),
+        )
+
+    def dictionary_progress(self, percent):
+        """Show how far the dictionary has loaded."""
+        self.statusBar().showMessage(f"Loading dictionary... {percent}%")
+
+    def dictionary_finished(self, error):
+        """Report that the dictionary finished loading."""
+        if error:
+            self.statusBar().showMessage("Dictionary failed to load")
+            self.show_message(f"Could not load the dictionary:\n{error}", "Dictionary Error")
+        else:
+            self.statusBar().showMessage("Dictionary ready", 3000)
+        if self.furigana.enabled:
+            # Pages painted while the dictionary was loading are annotated now
+            self.furigana.update_labels()
+
+    def selection_to_pdf_rect(self, label):
+        """Map a label's selection rectangle to PDF coordinates of its page."""
+        rect = label.selection_rect
 
         # Map pixmap coordinates to PDF coordinates
-        x0_pdf = x0_pixmap / self.scale_factor
-        y0_pdf = y0_pixmap / self.scale_factor
-        x1_pdf = x1_pixmap / self.scale_factor
-        y1_pdf = y1_pixmap / self.scale_factor
+        x0_pdf = rect.left() / label.scale
+        y0_pdf = rect.top() / label.scale
+        x1_pdf = rect.right() / label.scale
+        y1_pdf = rect.bottom() / label.scale
+
+        import fitz
+        return fitz.Rect(x0_pdf, y0_pdf, x1_pdf, y1_pdf)
+
+    def highlight_selection(self, note=''):
+        """Highlight the selection in the PDF and record it, with its text and note, in the notes store."""
+        label = self.active_label
+        if not label.selection_rect or label.page_number is None:
+            return
 
-        # Create a rectangle in PDF coordinates
-        pdf_rect = fitz.Rect(x0_pdf, y0_pdf, x1_pdf, y1_pdf)
+        page_number = label.page_number
+        page = self.doc.load_page(page_number)
+        pdf_rect = self.selection_to_pdf_rect(label)
 
         # Add highlight annotation to the rectangle
-        annot = page.add_highlight_annot(pdf_rect)
-        annot.set_colors(stroke=fitz.utils.getColor('yellow'))
-        annot.update()
+        annot = add_highlight(page, pdf_rect)
+
+        # Only the highlighted area of the cached renders has to be drawn again
+        old_revision = self.annot_revisions.get(page_number, 0)
+        self.display_lists.invalidate(self.doc, page_number)
+        self.annot_revisions[page_number] = old_revision + 1
+        self.patch_renders(page_number, annot.rect, old_revision)
+        self.refresh_page(page_number)
+
+        self.highlight_saver.add(page_number, pdf_rect)
+        self.unsaved_pages.add(page_number)
+        self.save_timer.start()
+
+        text = self.text_in_selection(label) or ''
+        highlight = self.notes_store.add(self.document.hash, self.doc_path, page_number, tuple(pdf_rect),
+                                         text, note, self.headword(text), self.notes_signals.written.emit)
+        notes = self.page_notes.get((self.doc_path, page_number))
+        if notes is not None:
+            notes.append(highlight)
+
+    def highlight_written(self, highlight, error):
+        """Read a page's highlights again once a new one is committed, or failed to be.
+
+        The page may have been read while the highlight was still queued.
+        """
+        self.page_notes.invalidate(highlight.doc_path, highlight.page)
+        if error is not None:
+            self.statusBar().showMessage(f"Could not record the highlight in the notes: {error}")
+
+    def highlight_with_note(self):
+        """Ask for a note, then highlight the selection with it."""
+        note, ok = QInputDialog.getMultiLineText(self, "Highlight Note", "Note:")
+        if ok:
+            self.highlight_selection(note)
+
+    def headword(self, text):
+        """Get the dictionary form of the word a text starts with, if the dictionary is loaded."""
+        if not self.dictionary.is_ready() or self.dictionary.error is not None:
+            return None
+        match = self.dictionary.longest_match(clean_word(text))
+        return match[1] if match else None
+
+    def highlights_on_page(self, page_number):
+        """Get the recorded highlights of a page of the open document, reading them on first use."""
+        key = (self.doc_path, page_number)
+        notes = self.page_notes.get(key)
+        if notes is None:
+            if not self.notes_store.is_ready():
+                return []
+            notes = self.notes_store.page_highlights(self.document.hash, page_number)
+            self.page_notes.put(key, notes, 200 * len(notes) + 64)
+        return notes
+
+    def note_at(self, label, pos):
+        """Get the note of the highlight under a point of a label, or None."""
+        if label.page_number is None or self.doc is None:
+            return None
+        x, y = pos.x() / label.scale, pos.y() / label.scale
+        for highlight in self.highlights_on_page(label.page_number):
+            x0, y0, x1, y1 = highlight.rect
+            if highlight.note and x0 <= x <= x1 and y0 <= y <= y1:
+                return highlight.note
+        return None
+
+    def set_note(self, highlight, note):
+        """Change the note of a stored highlight."""
+        highlight.note = note
+        self.notes_store.set_note(highlight.id, note)
+        for cached in self.page_notes.get((highlight.doc_path, highlight.page)) or ():
+            if cached.id == highlight.id:
+                cached.note = note
+
+    def open_notes(self):
+        """Show the notes browser."""
+        if self.notes_browser is None:
+            self.notes_browser = NotesBrowser(self)
+        self.notes_browser.show()
+        self.notes_browser.raise_()
+        self.notes_browser.query_edit.setFocus()
+        self.notes_browser.run_search()
+
+    def show_highlight(self, highlight):
+        """Open the book a highlight is in and go to it."""
+        if highlight.doc_path not in self.documents and not os.path.exists(highlight.doc_path or ''):
+            self.show_message(f"Could not find {highlight.doc_path}", "Open Error")
+            return
+        self.open_pdf(highlight.doc_path)
+        if self.doc_path == highlight.doc_path and highlight.page < len(self.document):
+            self.show_search_hit(highlight.page, [highlight.rect])
+
+    def patch_renders(self, page_number, rect, old_revision):
+        """Carry a page's cached renders over to its new revision, re-rendering only the rect that changed."""
+        revision = self.annot_revisions.get(page_number, 0)
+        display_list = self.display_lists.get(self.doc, page_number, revision)
+        for key in self.page_cache.keys(self.doc_path, page_number):
+            pixmap = self.page_cache.get(key)
+            self.page_cache.remove(key)
+            if key[3] != old_revision:
+                continue
+
+            # Where the render is on the page, in pixels, and the part of it that changed
+            scale = key[2]
+            left, top = (key[4] * TILE_SIZE, key[5] * TILE_SIZE) if len(key) > 4 else (0, 0)
+            x0, y0 = math.floor(rect.x0 * scale), math.floor(rect.y0 * scale)
+            x1, y1 = math.ceil(rect.x1 * scale), math.ceil(rect.y1 * scale)
+            dirty = QRect(x0, y0, x1 - x0, y1 - y0).intersected(QRect(left, top, pixmap.width(), pixmap.height()))
+
+            if not dirty.isEmpty():
+                pix = rasterize(display_list, scale, (dirty.left() / scale, dirty.top() / scale,
+                                                      (dirty.right() + 1) / scale, (dirty.bottom() + 1) / scale))
+                img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+                pixmap = pixmap.copy()
+                painter = QPainter(pixmap)
+                painter.drawImage(pix.x - left, pix.y - top, img)
+                painter.end()
+            self.page_cache.put(key[:3] + (revision,) + key[4:], pixmap,
+                                pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+
+    def save_highlights(self, document=None):
+        """Write out the highlights added to a document, the one being read by default, since the last save.
+
+        Returns False if they couldn't be saved.
+        """
+        document = document or self.document
+        if document is None or document.highlight_saver is None:
+            return True
+        try:
+            saved_to = document.highlight_saver.flush()
+        except OSError as e:
+            self.show_message(f"Could not save highlights:\n{e}", "Save Error")
+            return False
+        if saved_to == 'pdf':
+            self.statusBar().showMessage("Highlights saved", 3000)
+            # The workers reopen the file now that it changed, and see the highlights in it
+            document.unsaved_pages.clear()
+            # The file changed but its text didn't, so the search index still holds
+            index = self.search_index if document is self.document else SearchIndex(document.path)
+            if index is not None:
+                index.source_changed()
+        elif saved_to == 'sidecar':
+            self.statusBar().showMessage("Highlights saved next to the PDF", 3000)
+        return True
+
+    def page_scale(self, page_number):
+        """Get the scale that fits the page width to the viewport, including the zoom level."""
+        viewport_width = self.scroll_area.viewport().width()
+        base_scale = viewport_width / self.page_rects[page_number].width
+        return base_scale * self.scale_mod
 
-        # Re-render the page to show the highlight
-        self.show_page(self.current_page)
+    def page_key(self, page_number, scale):
+        """Get the render cache key for a page of the open document."""
+        return (self.doc_path, page_number, round(scale, 4), self.annot_revisions.get(page_number, 0))
 
+    def render_pixmap(self, page_number, key):
+        """Get a page's render from the cache, rasterizing it here if it isn't there."""
+        pixmap = self.page_cache.get(key)
+        if pixmap is None:
+            pixmap = self.rasterize_to_cache(page_number, key)
+        return pixmap
 
+    def rasterize_to_cache(self, page_number, key, clip=None):
+        """Rasterize a page, or the clip of it, on this thread and cache the result under the key."""
+        display_list = self.display_lists.get(self.doc, page_number, self.annot_revisions.get(page_number, 0))
+
+        # Generate the pixmap with the total scaling
+        with recorder.span('rasterize'):
+            pix = rasterize(display_list, key[2], clip)
+
+        with recorder.span('to_pixmap'):
+            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+            pixmap = QPixmap.fromImage(img)
+        size = pixmap.width() * pixmap.height() * pixmap.depth() // 8
+        recorder.set('last_pixmap_bytes', size)
+        recorder.count('pages_rasterized')
+        self.page_cache.put(key, pixmap, size)
+        return pixmap
+
+    @timed('show_page')
     def show_page(self, page_number):
         """Display the specified PDF page with the current zoom level."""
-        page = self.doc.load_page(page_number)
-
-        # Calculate the base scale factor to fit the page width to the viewport width
-        viewport_width = self.scroll_area.viewport().width()
-        page_width = page.rect.width
-        base_scale = viewport_width / page_width
+        if self.continuous:
+            self.continuous_view.scroll_to_page(page_number)
+            return
 
         # Calculate the total scale factor including zoom level
-        self.scale_factor = base_scale * self.scale_mod
+        self.scale_factor = self.page_scale(page_number)
 
-        # Generate the pixmap with the total scaling
-        pix = page.get_pixmap(
-            matrix=fitz.Matrix(self.scale_factor, self.scale_factor),
-            annots=True  # Include annotations
-        )
+        self.show_on_label(self.pdf_label, page_number, self.scale_factor)
+
+        self.prefetch_neighbours(page_number)
 
-        img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-        self.pdf_label.setPixmap(QPixmap.fromImage(img))
+    def show_on_label(self, label, page_number, scale):
+        """Show a page on a label, in one piece or in tiles depending on how big it gets."""
+        key = self.page_key(page_number, scale)
+        rect = self.page_rects[page_number]
+        if label.tiled and label.page_number != page_number:
+            self.prefetcher.cancel(('tiles', label.page_number))
+        if needs_tiles(rect, key[2]):
+            if label.key != key or not label.tiled:
+                label.show_tiled(page_number, key, *page_pixel_size(rect, key[2]))
+        else:
+            label.show_render(page_number, key, self.render_pixmap(page_number, key))
+
+    def request_tiles(self, label):
+        """Make sure the tiles in and just around the visible part of a tiled label get rendered."""
+        visible = label.visibleRegion().boundingRect().adjusted(-TILE_SIZE, -TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        tiles = tiles_in_rect(visible.x(), visible.y(), visible.width(), visible.height(), label.width(), label.height())
+        page_number, scale = label.page_number, label.key[2]
+
+        keys = []
+        clips = {}
+        for column, row in tiles:
+            key = label.key + (column, row)
+            if key in self.page_cache:
+                continue
+            if page_number in self.unsaved_pages:
+                # Unsaved highlights are only in our handle, so render those tiles here
+                self.rasterize_to_cache(page_number, key, tile_clip(column, row, scale))
+                label.update(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                continue
+            keys.append(key)
+            clips[key] = tile_clip(column, row, scale)
+
+        # Tiles that scrolled out of view before they were rendered are cancelled
+        self.prefetcher.prefetch(keys, group=('tiles', page_number), clips=clips)
+
+    def refresh_view(self):
+        """Lay out the open document again after the viewport or zoom level changed."""
+        if self.doc is None:
+            return
+        if self.continuous:
+            page_number = self.current_page
+            self.continuous_view.relayout()
+            self.continuous_view.scroll_to_page(page_number)
+        else:
+            self.show_page(self.current_page)
 
-        # Adjust the label size
-        self.pdf_label.resize(pix.width, pix.height)
+    def refresh_page(self, page_number):
+        """Show a page again after its contents changed."""
+        if self.continuous:
+            self.continuous_view.refresh_page(page_number)
+        elif page_number == self.current_page:
+            self.show_page(page_number)
 
-        # Ensure the scroll area resizes the widget
+    def set_continuous(self, enabled):
+        """Switch between showing one page at a time and scrolling through the whole document."""
+        if enabled == self.continuous:
+            return
+        page_number = self.current_page
+        self.prefetcher.cancel()
+
+        # The scroll area deletes the widget it holds when given another, so take it back first
+        self.scroll_area.takeWidget()
+        self.continuous = enabled
+        if enabled:
+            self.pdf_label.release()
+            self.scroll_area.setWidget(self.continuous_view)
+        else:
+            self.scroll_area.setWidget(self.container)
         self.scroll_area.setWidgetResizable(True)
 
+        self.current_page = page_number
+        self.refresh_view()
+
+    def prefetch_neighbours(self, page_number):
+        """Render the pages around the current one in the background, nearest first."""
+        keys = []
+        for offset in range(1, PREFETCH_DISTANCE + 1):
+            for neighbour in (page_number + offset, page_number - offset):
+                # Highlights not saved yet only exist in our handle, not in the file the workers read
+                if not 0 <= neighbour < len(self.doc) or neighbour in self.unsaved_pages:
+                    continue
+                key = self.page_key(neighbour, self.page_scale(neighbour))
+                # Tiled pages are only rendered where they are looked at
+                if key not in self.page_cache and not needs_tiles(self.page_rects[neighbour], key[2]):
+                    keys.append(key)
+        # Anything queued for other pages or another zoom level is cancelled
+        self.prefetcher.prefetch(keys)
+
+    def page_prefetched(self, key, image):
+        """Cache a page or tile rendered in the background if it is still current."""
+        page_key = key[:4]
+        if key[0] != self.doc_path or page_key != self.page_key(key[1], key[2]):
+            return
+        with recorder.span('to_pixmap'):
+            pixmap = QPixmap.fromImage(image)
+        recorder.count('pages_prefetched')
+        self.page_cache.put(key, pixmap, pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+
+        if len(key) > 4:
+            # A tile: repaint just its part of whichever label shows the page
+            label = self.continuous_view.labels.get(key[1]) if self.continuous else self.pdf_label
+            if label is not None and label.key == page_key:
+                column, row = key[4:]
+                label.update(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        elif self.continuous:
+            self.continuous_view.page_rendered(key, pixmap)
+
     def resize_to_fit(self):
         """Ensure the page is centered in the window."""
         self.pdf_label.adjustSize()
 
+    def schedule_refresh(self):
+        """Show a quick preview now and render at full quality once resizing or zooming settles."""
+        self.show_preview()
+        self.refresh_timer.start()
+
+    def show_preview(self):
+        """Stretch the page already on screen to the new scale as a stand-in for the real render."""
+        if self.doc is None or self.continuous:
+            return
+        label = self.pdf_label
+        pixmap = label.pixmap()
+        if label.tiled or label.page_number is None or pixmap is None or pixmap.isNull():
+            return
+        scale = self.page_scale(label.page_number)
+        rect = self.page_rects[label.page_number]
+        if needs_tiles(rect, scale):
+            return
+        label.show_preview(pixmap.scaled(*page_pixel_size(rect, scale), Qt.IgnoreAspectRatio, Qt.FastTransformation), scale)
+
     def resizeEvent(self, event):
         """Resize the PDF page when the window is resized."""
-        if self.doc is not None:
-            self.show_page(self.current_page)
+        self.schedule_refresh()
         super().resizeEvent(event)
 
-    def get_selected_text(self):
-        if not self.pdf_label.selection_rect:
+    def text_layout(self, page_number):
+        """Get the text layout of a page, extracting it on first use."""
+        key = (self.doc_path, page_number)
+        layout = self.text_layouts.get(key)
+        if layout is None:
+            layout = PageTextLayout(self.doc.load_page(page_number))
+            self.text_layouts.put(key, layout, layout.byte_size())
+        return layout
+
+    def text_in_selection(self, label):
+        """Get the text under a label's selection rectangle."""
+        if not label.selection_rect or label.page_number is None or self.doc is None:
             return None
+        rect = self.selection_to_pdf_rect(label)
+        selected_text = self.text_layout(label.page_number).text_in_rect(rect.x0, rect.y0, rect.x1, rect.y1)
+        return selected_text.strip() or None
 
-        page = self.doc.load_page(self.current_page)
-        rect = self.pdf_label.selection_rect
-
-        # Adjust rectangle coordinates
-        x0 = rect.left() - self.pdf_label.get_label_position()[0] - self.scroll_area.horizontalScrollBar().value()
-        y0 = rect.top() - self.pdf_label.get_label_position()[1] - self.scroll_area.verticalScrollBar().value()
-        x1 = rect.right() - self.pdf_label.get_label_position()[0] - self.scroll_area.horizontalScrollBar().value()
-        y1 = rect.bottom() - self.pdf_label.get_label_position()[1] - self.scroll_area.verticalScrollBar().value()
-
-        # Map to PDF coordinates
-        x0_pdf = x0 / self.scale_factor
-        y0_pdf = y0 / self.scale_factor
-        x1_pdf = x1 / self.scale_factor
-        y1_pdf = y1 / self.scale_factor
+    def preview_selection(self, label):
+        """Show the text being selected in the status bar while dragging."""
+        selected_text = self.text_in_selection(label)
+        if selected_text:
+            self.statusBar().showMessage(selected_text.replace('\n', ' '))
+        else:
+            self.statusBar().clearMessage()
+
+    def start_indexing(self, file_path):
+        """Index the text of a newly opened document for searching."""
+        if self.search_index is not None:
+            self.search_index.stop()
+        self.search_hits = {}
+        self.search_index = SearchIndex(file_path)
+        self.search_index.start(
+            page_callback=self.search_signals.page_indexed.emit,
+            done_callback=lambda error: self.search_signals.finished.emit(str(error) if error else ''),
+        )
+        if self.search_dialog is not None:
+            self.search_dialog.run_search()
+
+    def page_indexed(self, page_number):
+        """Pass a newly indexed page on to the search dialog so it can add its hits."""
+        if self.search_dialog is not None and self.search_dialog.isVisible():
+            self.search_dialog.page_indexed(page_number)
+
+    def indexing_finished(self, error):
+        """Report that indexing stopped."""
+        if error:
+            self.statusBar().showMessage(f"Could not index the document for searching: {error}", 5000)
+        if self.search_dialog is not None:
+            self.search_dialog.update_status()
+
+    def open_search(self):
+        """Show the search dialog."""
+        if self.search_dialog is None:
+            self.search_dialog = SearchDialog(self)
+        self.search_dialog.show()
+        self.search_dialog.raise_()
+        self.search_dialog.query_edit.setFocus()
+        self.search_dialog.update_status()
+
+    def show_search_hit(self, page_number, rects):
+        """Go to a search hit and mark it on the page."""
+        self.search_hits = {page_number: rects}
+        self.current_page = page_number
+        self.show_page(page_number)
+        self.pdf_label.update()
+        for label in self.continuous_view.labels.values():
+            label.update()
+
+    def export_trace(self):
+        """Save the recorded timings as a Chrome trace file."""
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Performance Trace", "trace.json", "JSON Files (*.json)")
+        if file_path:
+            recorder.export_chrome_trace(file_path)
+            self.statusBar().showMessage(f"Trace saved to {file_path}", 3000)
 
-        selected_text = page.get_text("text", clip=fitz.Rect(x0_pdf, y0_pdf, x1_pdf, y1_pdf))
-        self.last_selected_text = selected_text.strip() if selected_text else None
+    @timed('get_selected_text')
+    def get_selected_text(self):
+        self.last_selected_text = self.text_in_selection(self.active_label)
         return self.last_selected_text
 
     def search_selected_text(self):
         """Search the selected text in the dictionary."""
+        if not self.dictionary.is_ready():
+            percent = int(self.dictionary.progress * 100)
+            self.show_message(f"The dictionary is still loading ({percent}%). Try again in a moment.", "Dictionary Loading")
+            return
+        if self.dictionary.error is not None:
+            self.show_message("The dictionary could not be loaded.", "Dictionary Error")
+            return
+
         selected_text = self.get_selected_text()
         if selected_text:
             clean_text = self.clean_word(selected_text)
@@ -157,145 +709,31 @@ class PDFReader(QMainWindow):
 
     def clean_word(self, word):
         """Clean and normalize the extracted word for Japanese word lookup."""
-        word = re.sub(r'[^\u3040-\u30FF\u4E00-\u9FAF]', '', word)
-        return word
-
-    def split_into_possible_words(self, text):
-        """Split the text into individual words."""
-        words = []
-        length = len(text)
+        return clean_word(word)
 
-        for start in range(length):
-            for end in range(start + 1, length + 1):
-                candidate_word = text[start:end]
-                if self.dictionary.search_word(candidate_word):
-                    words.append(candidate_word)
-        return words
+    @timed('split_into_possible_words')
+    def split_into_possible_words(self, text, longest=False):
+        """Split the text into individual words, giving inflected words in their dictionary form."""
+        return split_into_possible_words(self.dictionary, text, longest)
 
     def show_word_list(self, words, selected_text):
-        """Show a list of possible words from the selection to choose one for full details."""
-        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Select a Word")
-        dialog.setGeometry(200, 200, 300, 400)
-
-        layout = QVBoxLayout()
-
-        word_list = QListWidget()
-        word_list.addItems(words)
-
-        font = QFont()
-        font.setPointSize(30)
-        word_list.setFont(font)
-
-        layout.addWidget(word_list)
-
-        button_layout = QHBoxLayout()
-
-        copy_button = QPushButton("Copy")
-        button_layout.addWidget(copy_button)
-
-        close_button = QPushButton("Close")
-        button_layout.addWidget(close_button)
-
-        layout.addLayout(button_layout)
-
-        dialog.setLayout(layout)
-
-        def word_selected():
-            selected_word = word_list.currentItem().text()
-            self.show_definition(selected_word)
-
-        word_list.itemClicked.connect(word_selected)
-
-        # Copy button functionality
-        def copy_selected_text():
-            clipboard = QApplication.clipboard()
-            clipboard.setText(selected_text)
-            QMessageBox.information(self, "Copied", "Selected text copied to clipboard.")
-
-        copy_button.clicked.connect(copy_selected_text)
-        close_button.clicked.connect(dialog.close)
-
-        dialog.exec_()
-
+        """Show the possible words of a selection in the lookup panel."""
+        self.lookup_panel.show_words(words, selected_text)
 
     def show_definition(self, word):
-        """Show the dictionary definition in a pop-up."""
-        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTextEdit
-
-        entries = self.dictionary.search_word(word)
-
-        if entries:
-            result_text = ""
-            for entry in entries:
-                word_text = entry.get("word", "")
-                reading = entry.get("reading", "")
-                tags = entry.get("tags", "")
-
-                result_text += f"Word: {word_text}\n"
-                result_text += f"Reading: {reading}\n"
-                result_text += f"Tags: {tags}\n\n"
-
-                meanings = entry.get("meaning", [])
-                if meanings:
-                    result_text += "Meanings:\n"
-                    for meaning in meanings:
-                        result_text += f"- {meaning}\n"
-                else:
-                    result_text += "Meanings: None\n"
-
-                s_inf = entry.get("notes", [])
-                if s_inf:
-                    result_text += "Other Info:\n"
-                    for example in s_inf:
-                        result_text += f"- {example}\n"
-                    else:
-                        result_text += "Other Info: None\n"
-
-                result_text += "\n---\n"
-
-        else:
-            result_text = "Word not found."
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Dictionary Entry")
-        dialog.setGeometry(200, 200, 400, 400)
-
-        layout = QVBoxLayout()
-
-        text_edit = QTextEdit()
-        text_edit.setReadOnly(True)
-        text_edit.setText(result_text)
-        layout.addWidget(text_edit)
-        
-        font = QFont()
-        font.setPointSize(20)
-        text_edit.setFont(font)
-
-        button_layout = QHBoxLayout()
-
-        copy_button = QPushButton("Copy")
-        button_layout.addWidget(copy_button)
-
-        close_button = QPushButton("Close")
-        button_layout.addWidget(close_button)
-
-        layout.addLayout(button_layout)
-
-        dialog.setLayout(layout)
-
-        # Copy button functionality
-        def copy_word():
-            clipboard = QApplication.clipboard()
-            clipboard.setText(word)
-            QMessageBox.information(self, "Copied", f"'{word}' copied to clipboard.")
-
-        copy_button.clicked.connect(copy_word)
-        close_button.clicked.connect(dialog.close)
-
-        dialog.exec_()
+        """Show the dictionary definition of a word in the lookup panel."""
+        self.lookup_panel.show_definition(word)
+
+    def closeEvent(self, event):
+        """Save pending highlights and stop the render workers along with the window."""
+        self.save_timer.stop()
+        self.save_highlights()
+        if self.search_index is not None:
+            self.search_index.stop()
+        self.furigana.stop()
+        self.notes_store.stop()
+        self.prefetcher.shutdown()
+        super().closeEvent(event)
 
     def show_message(self, text, title):
         """Show a simple pop-up message."""
@@ -315,14 +753,15 @@ class PDFReader(QMainWindow):
 
     def zoom_in(self):
         """Increase the zoom level."""
-        self.scale_mod += 0.1
-        self.show_page(self.current_page)
+        if self.scale_mod < MAX_SCALE_MOD:
+            self.scale_mod += 0.1
+            self.schedule_refresh()
 
     def zoom_out(self):
         """Decrease the zoom level."""
         if self.scale_mod > 0.2:
             self.scale_mod -= 0.1
-            self.show_page(self.current_page)
+            self.schedule_refresh()
 
 
     def next_page(self):
@@ -338,91 +777,129 @@ class PDFReader(QMainWindow):
             self.show_page(self.current_page)
 
     def load_pdf(self):
-        """Load the PDF and show only the first page."""
+        """Ask for a PDF and open it."""
         options = QFileDialog.Options()
         file_path, _ = QFileDialog.getOpenFileName(self, "Open PDF", "", "PDF Files (*.pdf)", options=options)
         if file_path:
-            self.doc = fitz.open(file_path)
-            self.current_page = 0
-            self.show_page(self.current_page)
-
-class PDFLabel(QLabel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.main_window = parent  # Reference to PDFReader
-        self.selection_start = None
-        self.selection_end = None
-        self.selection_rect = None
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            label_x, label_y = self.get_label_position()
-            scroll_x = self.main_window.scroll_area.horizontalScrollBar().value()
-            scroll_y = self.main_window.scroll_area.verticalScrollBar().value()
-            pos_x = event.pos().x() + label_x + scroll_x
-            pos_y = event.pos().y() + label_y + scroll_y
-            self.selection_start = QPoint(int(pos_x), int(pos_y))
-            self.update()
-
-
-    def mouseMoveEvent(self, event):
-        if self.selection_start:
-            label_x, label_y = self.get_label_position()
-            scroll_x = self.main_window.scroll_area.horizontalScrollBar().value()
-            scroll_y = self.main_window.scroll_area.verticalScrollBar().value()
-            pos_x = label_x + event.pos().x() + scroll_x
-            pos_y = label_y + event.pos().y() + scroll_y
-            self.selection_end = QPoint(pos_x, pos_y)
-            self.selection_rect = QRect(self.selection_start, self.selection_end)
-            self.update()
-
-    def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and self.selection_rect:
-            label_x, label_y = self.get_label_position()
-            scroll_x = self.main_window.scroll_area.horizontalScrollBar().value()
-            scroll_y = self.main_window.scroll_area.verticalScrollBar().value()
-            pos_x = label_x + event.pos().x() + scroll_x
-            pos_y = label_y + event.pos().y() + scroll_y
-            self.selection_end = QPoint(pos_x, pos_y)
-            self.selection_rect = QRect(self.selection_start, self.selection_end)
-            selected_text = self.main_window.get_selected_text()
-            if selected_text:
-                self.main_window.context_menu.exec_(event.globalPos())
-            else:
-                self.main_window.show_message("No valid text selected.", "Selection Error")
-            # Clear the selection after using it
-            self.selection_start = None
-            self.selection_end = None
-            self.selection_rect = None
-            self.update()
-
-    def paintEvent(self, event):
-        super().paintEvent(event)
-        if self.selection_rect:
-            painter = QPainter(self)
-            painter.setRenderHint(QPainter.Antialiasing)
-            br = QBrush(QColor(0, 0, 255, 50))
-            painter.setBrush(br)
-            painter.setPen(QPen(QColor(0, 0, 255), 1))
-
-            # Get positions
-            label_x, label_y = self.get_label_position()
-            scroll_x = self.main_window.scroll_area.horizontalScrollBar().value()
-            scroll_y = self.main_window.scroll_area.verticalScrollBar().value()
-
-            # Adjust selection start and end positions
-            x0 = self.selection_start.x() - label_x - scroll_x
-            y0 = self.selection_start.y() - label_y - scroll_y
-            x1 = self.selection_end.x() - label_x - scroll_x
-            y1 = self.selection_end.y() - label_y - scroll_y
-
-            # Create QRect with adjusted positions
-            rect = QRect(int(x0), int(y0), int(x1 - x0), int(y1 - y0))
-            painter.drawRect(rect)
-            painter.end()
-    def get_label_position(self):
-        """Get the position of the label within the scroll area's viewport."""
-        pos = self.mapTo(self.main_window.scroll_area.viewport(), QPoint(0, 0))
-        return pos.x(), pos.y()
-
-    
\ No newline at end of file
+            self.open_pdf(file_path)
+
+    @timed('load_pdf')
+    def open_pdf(self, file_path):
+        """Open a PDF in a new tab and show its first page, or go to its tab if it is open already."""
+        file_path = os.path.abspath(file_path)
+        if file_path in self.documents:
+            self.tab_bar.setCurrentIndex(self.tab_index(file_path))
+            return
+        import fitz
+        try:
+            doc = fitz.open(file_path)
+        except Exception as e:  # MuPDF's own errors don't derive from the built-in ones
+            self.show_message(f"Could not open {file_path}:\n{e}", "Open Error")
+            return
+        document = self.documents[file_path] = Document(file_path, doc)
+
+        # The tab is set up before anything hears about it, then the document is shown here
+        self.tab_bar.blockSignals(True)
+        index = self.tab_bar.addTab(os.path.basename(file_path))
+        self.tab_bar.setTabData(index, file_path)
+        self.tab_bar.setTabToolTip(index, file_path)
+        self.tab_bar.setCurrentIndex(index)
+        self.tab_bar.blockSignals(False)
+        self.activate_document(document)
+
+        if self.startup_timer is not None:
+            self.startup_timer.milestone('first page rendered')
+            self.startup_timer.finish()
+            self.startup_timer = None
+
+    def activate_document(self, document):
+        """Show a document where it was left, keeping the caches of the one it replaces."""
+        if self.document is not None:
+            self.save_timer.stop()
+            self.save_highlights()
+            self.prefetcher.cancel()
+        self.hover_lookup.hide()
+        self.furigana.cancel()
+        self.document = document
+        self.cache_manager.activate(document.path)
+        self.close_idle_documents()
+        self.refresh_view()
+        self.start_indexing(document.path)
+
+    def close_idle_documents(self):
+        """Close the MuPDF handles of the documents read longest ago; what is cached for them stays."""
+        for path in list(self.cache_manager.documents)[:-MAX_OPEN_DOCUMENTS]:
+            document = self.documents.get(path)
+            if document is not None and document.is_open():
+                doc = document.doc
+                if not self.save_highlights(document) or not document.close():
+                    self.statusBar().showMessage(
+                        f"Kept {os.path.basename(path)} open, its highlights couldn't be saved")
+                    continue
+                self.display_lists.invalidate(doc)
+
+    def tab_index(self, path):
+        """Get the index of a document's tab."""
+        for index in range(self.tab_bar.count()):
+            if self.tab_bar.tabData(index) == path:
+                return index
+        return -1
+
+    def tab_changed(self, index):
+        """Show the document of the tab picked."""
+        document = self.documents.get(self.tab_bar.tabData(index)) if index >= 0 else None
+        if document is not None and document is not self.document:
+            self.activate_document(document)
+
+    def close_current_document(self):
+        if self.document is not None:
+            self.close_document(self.tab_bar.currentIndex())
+
+    def close_document(self, index):
+        """Close a document's tab and drop everything kept for it.
+
+        The tab stays if the document's highlights couldn't be saved.
+        """
+        document = self.documents[self.tab_bar.tabData(index)]
+        if document is self.document:
+            self.save_timer.stop()
+        doc = document.doc
+        if not self.save_highlights(document) or not document.close():
+            self.statusBar().showMessage(f"Kept {os.path.basename(document.path)} open, its highlights couldn't be saved")
+            return
+        del self.documents[document.path]
+        if document is self.document:
+            self.prefetcher.cancel()
+            if self.search_index is not None:
+                self.search_index.stop()
+                self.search_index = None
+            self.search_hits = {}
+            self.hover_lookup.hide()
+            self.document = None
+        if doc is not None:
+            self.display_lists.invalidate(doc)
+        self.cache_manager.forget(document.path)
+        self.furigana.cancel()
+        # Removing the current tab makes the next one current, which shows its document
+        self.tab_bar.removeTab(index)
+        if self.document is None:
+            # That was the last one
+            self.pdf_label.release()
+            if self.continuous:
+                self.continuous_view.relayout()
+
+class SearchSignals(QObject):
+    """Carries indexing updates from the indexer thread to the GUI thread."""
+    page_indexed = pyqtSignal(int)
+    finished = pyqtSignal(str)
+
+
+class NotesSignals(QObject):
+    """Carries highlights the notes writer thread committed, or failed to, to the GUI thread."""
+    written = pyqtSignal(object, object)
+
+
+class DictionarySignals(QObject):
+    """Carries dictionary loading updates from the loader thread to the GUI thread."""
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
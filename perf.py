@@ -0,0 +1,154 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Spans kept for the trace export; older ones are dropped
+MAX_EVENTS = 100000
+
+
+class Histogram:
+    """Durations of a span, bucketed by powers of two microseconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+        bucket = max(0, int(seconds * 1e6)).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Get the upper edge, in seconds, of the bucket the given fraction of durations fall under."""
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return min(self.max, (1 << bucket) / 1e6)
+        return self.max
+
+
+class _Span:
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, self.start, time.perf_counter(), self.args)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Recorder:
+    """Collects timing spans, histograms and counters while enabled.
+
+    Disabled, a span is a shared do-nothing object and a counter update is
+    one attribute check, so the instrumentation can stay in the hot paths.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.histograms = {}
+        self.counters = {}
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **args):
+        """Time a block: `with recorder.span('name'): ...`."""
+        if not self.enabled:
+            return _null_span
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        """Add a finished span, with perf_counter() start and end times."""
+        thread = threading.current_thread()
+        with self._lock:
+            self.events.append((name, start, end, thread.ident, args))
+            self.thread_names.setdefault(thread.ident, thread.name)
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(end - start)
+
+    def count(self, name, value=1):
+        """Add to a counter."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set a counter to the latest value of something, like the size of the last render."""
+        if self.enabled:
+            self.counters[name] = value
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.histograms.clear()
+            self.counters.clear()
+
+    def chrome_trace(self):
+        """Get the recorded spans in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        with self._lock:
+            events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args or {}}
+                      for name, start, end, tid, args in self.events]
+            events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                       for tid, name in self.thread_names.items()]
+            events += [{'name': name, 'ph': 'C', 'pid': pid, 'ts': (time.perf_counter() - self.origin) * 1e6,
+                        'args': {'value': value}}
+                       for name, value in self.counters.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# Shared by the whole process; set JPDF_PERF=1 to record from startup
+recorder = Recorder(enabled=bool(os.environ.get('JPDF_PERF')))
+
+
+def timed(name):
+    """Decorate a function to record a span named name around every call while recording is enabled."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(name, start, time.perf_counter())
+        return wrapper
+    return decorate
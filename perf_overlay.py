@@ -0,0 +1,59 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer
+
+from perf import recorder
+
+# How often the overlay refreshes its numbers
+OVERLAY_INTERVAL_MS = 500
+
+
+class PerfOverlay(QLabel):
+    """A corner of the window showing the recorded span timings and counters."""
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: white; padding: 6px;")
+        self.setFont(QFont("monospace", 9))
+        self.setTextFormat(Qt.PlainText)
+        self.timer = QTimer(self)
+        self.timer.setInterval(OVERLAY_INTERVAL_MS)
+        self.timer.timeout.connect(self.update_stats)
+        self.was_recording = recorder.enabled  # Whether recording was on before the overlay turned it on
+        self.hide()
+
+    def set_visible(self, visible):
+        """Show or hide the overlay, recording only while it is shown unless JPDF_PERF is set."""
+        if visible:
+            if not self.isVisible():
+                self.was_recording = recorder.enabled
+            recorder.enabled = True
+            self.update_stats()
+            self.show()
+            self.raise_()
+            self.timer.start()
+        else:
+            self.timer.stop()
+            self.hide()
+            recorder.enabled = self.was_recording
+
+    def update_stats(self):
+        lines = [f"{'span':24} {'last':>8} {'mean':>8} {'p95':>8} {'n':>6}"]
+        for name, histogram in sorted(recorder.histograms.items()):
+            lines.append(f"{name:24} {histogram.last * 1000:8.2f} {histogram.mean() * 1000:8.2f} "
+                         f"{histogram.percentile(0.95) * 1000:8.2f} {histogram.count:6}")
+        for name, value in sorted(recorder.counters.items()):
+            lines.append(f"{name:24} {value:>8}")
+
+        page_cache = self.main_window.page_cache.stats()
+        lines.append(f"{'page cache':24} {page_cache['entries']:>8} pages "
+                     f"{page_cache['bytes'] / (1024 * 1024):.1f} MB, hit rate {page_cache['hit_rate']:.0%}")
+        cache_manager = self.main_window.cache_manager
+        lines.append(f"{'all caches':24} {cache_manager.size() / (1024 * 1024):8.1f} MB of "
+                     f"{cache_manager.budget / (1024 * 1024):.0f}, {len(self.main_window.documents)} documents, "
+                     f"{cache_manager.evictions} evicted")
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+        self.move(self.main_window.width() - self.width() - 24, self.main_window.menuBar().height() + 8)
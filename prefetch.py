@@ -0,0 +1,96 @@
+from functools import partial
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from rendering import render_page
+
+
+class PagePrefetcher(QObject):
+    """Renders pages ahead of time on a pool of worker processes.
+
+    MuPDF holds the GIL while it rasterizes, so worker threads would still
+    stall the GUI; separate processes, each with its own handle on the
+    document, don't. Finished renders arrive on the GUI thread through
+    page_rendered as (key, QImage), where key is the (path, page number,
+    scale, ...) tuple the job was queued with.
+    """
+    page_rendered = pyqtSignal(object, QImage)
+    _rendered = pyqtSignal(object, object, QImage)
+
+    def __init__(self, workers=2, parent=None):
+        super().__init__(parent)
+        self.workers = workers
+        self._pool = None
+        self._jobs = {}
+        self._rendered.connect(self._deliver)
+
+    def pool(self):
+        """Start the worker processes on first use."""
+        if self._pool is None:
+            # Imported here, multiprocessing is a noticeable part of startup time
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def prefetch(self, keys, group='pages', clips=None):
+        """Queue renders for the given keys, cancelling the group's queued jobs for any other keys.
+
+        clips maps a key to the part of the page to render, in PDF coordinates;
+        keys without one render the whole page.
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        keys = list(keys)
+        for key in [key for key, (_, job_group) in self._jobs.items() if job_group == group and key not in keys]:
+            self._jobs.pop(key)[0].cancel()
+
+        for key in keys:
+            if key in self._jobs:
+                continue
+            path, page_number, scale = key[:3]
+            clip = clips.get(key) if clips else None
+            try:
+                future = self.pool().submit(render_page, path, page_number, scale, clip)
+            except BrokenProcessPool:
+                # A worker died (e.g. MuPDF crashed on a bad page); start over with fresh ones
+                self._pool = None
+                future = self.pool().submit(render_page, path, page_number, scale, clip)
+            future.add_done_callback(partial(self._finished, key))
+            self._jobs[key] = (future, group)
+
+    def cancel(self, group=None):
+        """Cancel the queued jobs of a group, or every queued job."""
+        for key in [key for key, (_, job_group) in self._jobs.items() if group is None or job_group == group]:
+            self._jobs.pop(key)[0].cancel()
+
+    def pending(self, key):
+        """Check whether a render for the key is queued or running."""
+        return key in self._jobs
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        self.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _finished(self, key, future):
+        """Turn a finished render into a QImage, on whichever thread the pool calls back on."""
+        if future.cancelled():
+            return
+        image = QImage()
+        if future.exception() is None:
+            width, height, stride, samples = future.result()
+            image = QImage(samples, width, height, stride, QImage.Format_RGB888).copy()
+        self._rendered.emit(key, future, image)
+
+    def _deliver(self, key, future, image):
+        """Hand a render to the GUI thread unless its job was cancelled meanwhile."""
+        if self._jobs.get(key, (None,))[0] is not future:
+            return
+        del self._jobs[key]
+        if not image.isNull():
+            self.page_rendered.emit(key, image)
@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+
+from documents import MAX_OPEN_DOCUMENTS
+
+# Documents opened by this process, keyed by path, with the mtime and size they were opened at,
+# the one used longest ago first
+_documents = OrderedDict()
+
+
+class DisplayListCache:
+    """Keeps the parsed content of recently rendered pages.
+
+    Rasterizing a page from its display list skips interpreting the content
+    stream again, which is most of the work when the same page is rendered
+    at another scale or one tile at a time.
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+        self._lists = OrderedDict()
+
+    def get(self, doc, page_number, revision=0):
+        """Get the display list of a page, parsing the page on first use.
+
+        revision tells apart versions of a page whose annotations changed.
+        """
+        key = (doc, page_number, revision)
+        display_list = self._lists.get(key)
+        if display_list is None:
+            display_list = doc.load_page(page_number).get_displaylist(annots=True)
+            self._lists[key] = display_list
+            if len(self._lists) > self.size:
+                self._lists.popitem(last=False)
+        else:
+            self._lists.move_to_end(key)
+        return display_list
+
+    def invalidate(self, doc, page_number=None):
+        """Forget the display lists of a page, or of the whole document."""
+        for key in [key for key in self._lists
+                    if key[0] is doc and (page_number is None or key[1] == page_number)]:
+            del self._lists[key]
+
+
+_display_lists = DisplayListCache()
+
+
+def rasterize(display_list, scale, clip=None):
+    """Rasterize a display list at a scale, optionally only a part of it in PDF coordinates."""
+    import fitz
+    return display_list.get_pixmap(
+        matrix=fitz.Matrix(scale, scale),
+        clip=fitz.Rect(clip) if clip is not None else None,
+        alpha=False
+    )
+
+
+def open_document(path):
+    """Open a document for this process, reopening it if the file changed on disk."""
+    import fitz
+    stat = os.stat(path)
+    # Saving highlights appends to the file, so its size changes even if its mtime doesn't show it
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _documents.pop(path, None)
+    if cached is not None and cached[1] == version:
+        _documents[path] = cached
+        return cached[0]
+    if cached is not None:
+        close_document(cached[0])
+    doc = fitz.open(path)
+    _documents[path] = (doc, version)
+    # Like the reader's own handles, only the documents read most recently stay open
+    while len(_documents) > MAX_OPEN_DOCUMENTS:
+        close_document(_documents.popitem(last=False)[1][0])
+    return doc
+
+
+def close_document(doc):
+    """Close a document opened by open_document, along with its display lists."""
+    _display_lists.invalidate(doc)
+    doc.close()
+
+
+def render_page(path, page_number, scale, clip=None):
+    """Rasterize a page from a file, returning (width, height, stride, RGB samples).
+
+    Runs in the render worker processes, which each keep their own handle on
+    the document, so it only deals in paths and plain values.
+    """
+    display_list = _display_lists.get(open_document(path), page_number)
+    pix = rasterize(display_list, scale, clip)
+    return pix.width, pix.height, pix.stride, pix.samples
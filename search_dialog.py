@@ -0,0 +1,79 @@
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QLabel
+from PyQt5.QtCore import Qt, QTimer
+
+# How long typing has to pause before the query is searched
+SEARCH_DELAY_MS = 200
+
+
+class SearchDialog(QDialog):
+    """Searches the open document, adding hits from pages as they get indexed."""
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window  # Reference to PDFReader
+        self.query = ''
+        self.searched_pages = set()  # Pages whose hits for the query are listed already
+        self.setWindowTitle("Search Document")
+        self.setGeometry(200, 200, 400, 500)
+
+        layout = QVBoxLayout()
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Search...")
+        layout.addWidget(self.query_edit)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.results = QListWidget()
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.query_edit.textChanged.connect(self.search_timer.start)
+        self.query_edit.returnPressed.connect(self.run_search)
+        self.results.itemActivated.connect(self.hit_selected)
+        self.results.itemClicked.connect(self.hit_selected)
+
+    def run_search(self):
+        """Search the pages indexed so far; later pages are added by page_indexed."""
+        self.search_timer.stop()
+        self.query = self.query_edit.text().strip()
+        self.results.clear()
+        self.searched_pages = set()
+        index = self.main_window.search_index
+        if index is not None:
+            # Read before searching: a page indexed in between is either in the hits or has none
+            searched_pages = index.indexed_page_numbers()
+            hits = index.search(self.query)
+            self.searched_pages = searched_pages | {page_number for page_number, _, _ in hits}
+            self.add_hits(hits)
+        self.update_status()
+
+    def page_indexed(self, page_number):
+        """Add the hits on a page that was just indexed."""
+        index = self.main_window.search_index
+        if self.query and index is not None and page_number not in self.searched_pages:
+            self.searched_pages.add(page_number)
+            self.add_hits(index.search_page(page_number, self.query))
+        self.update_status()
+
+    def add_hits(self, hits):
+        for page_number, rects, snippet in hits:
+            item = QListWidgetItem(f"Page {page_number + 1}: {snippet}")
+            item.setData(Qt.UserRole, (page_number, rects))
+            self.results.addItem(item)
+
+    def hit_selected(self, item):
+        page_number, rects = item.data(Qt.UserRole)
+        self.main_window.show_search_hit(page_number, rects)
+
+    def update_status(self):
+        """Show how many hits there are and how far indexing has got."""
+        index = self.main_window.search_index
+        status = f"{self.results.count()} hits" if self.query else ""
+        if index is not None and not index.ready.is_set():
+            status += f" (indexed {index.indexed_pages} of {index.page_count} pages)"
+        elif index is not None and index.error is not None:
+            status += f" (indexing failed: {index.error})"
+        self.status_label.setText(status.strip())
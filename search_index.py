@@ -0,0 +1,262 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+from text_layout import PageTextLayout
+
+# Bump whenever the layout of the index changes so old files get rebuilt.
+INDEX_VERSION = 1
+
+# Longest character n-gram indexed. Japanese has no spaces to split words on, so
+# pages are found by the n-grams of the query and then checked against their text.
+GRAM_SIZE = 2
+
+# Characters of context shown either side of a hit
+SNIPPET_CONTEXT = 12
+
+
+def file_hash(path):
+    """Hash a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_grams(text):
+    """Get every distinct n-gram of a page's text, up to GRAM_SIZE characters long."""
+    grams = set()
+    for size in range(1, GRAM_SIZE + 1):
+        grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+    grams.discard(' ')
+    return grams
+
+
+def query_grams(query):
+    """Get the n-grams every page containing the query must have."""
+    size = min(GRAM_SIZE, len(query))
+    return sorted({query[i:i + size] for i in range(len(query) - size + 1)})
+
+
+class SearchIndex:
+    """An n-gram index of the text of a PDF, built page by page in the background.
+
+    The index is kept in a SQLite file next to the PDF and tied to the hash of
+    the PDF, so reopening a book only extracts the pages it hasn't got to yet.
+    A page's text is stored along with its character boxes, which is where
+    the rectangles of a hit come from.
+    """
+
+    def __init__(self, pdf_path, index_file=None):
+        self.pdf_path = pdf_path
+        self.index_file = index_file or pdf_path + '.search.sqlite'
+        self._local = threading.local()
+        self.opened = threading.Event()
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._reopen = threading.Event()  # Set when the PDF changed on disk
+        self._thread = None
+        self.page_count = 0
+        self.indexed_pages = 0
+        self.error = None
+
+    def start(self, page_callback=None, done_callback=None):
+        """Index the document in a background thread.
+
+        page_callback gets the number of every page newly added to the index and
+        done_callback gets None on success or the exception that stopped the
+        indexing. Both are called from the worker thread.
+        """
+        def run():
+            try:
+                self.build(page_callback)
+            except Exception as e:
+                self.error = e
+            self.ready.set()
+            if done_callback:
+                done_callback(self.error)
+
+        self._thread = threading.Thread(target=run, name='Search indexer', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop indexing after the page being indexed; the pages done so far are kept."""
+        self._stop.set()
+
+    def is_ready(self):
+        """Check whether every page is indexed."""
+        return self.ready.is_set() and self.error is None
+
+    def connection(self):
+        """Get this thread's read-only connection to the index."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(self.index_file).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def open_index(self, source_hash):
+        """Open the index for writing, starting over if it belongs to another version of the PDF."""
+        if os.path.exists(self.index_file):
+            conn = sqlite3.connect(self.index_file)
+            try:
+                meta = dict(conn.execute('SELECT key, value FROM meta'))
+            except sqlite3.Error:
+                meta = {}
+            if meta.get('version') == str(INDEX_VERSION) and meta.get('source_hash') == source_hash:
+                return conn
+            conn.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.index_file + suffix):
+                    os.remove(self.index_file + suffix)
+
+        conn = sqlite3.connect(self.index_file)
+        # Let searches read while pages are being added
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            # text holds one character per box; boxes and line_starts are packed arrays
+            conn.execute('CREATE TABLE pages (page INTEGER PRIMARY KEY, text TEXT, boxes BLOB, line_starts BLOB)')
+            conn.execute('CREATE TABLE grams (gram TEXT NOT NULL, page INTEGER NOT NULL, '
+                         'PRIMARY KEY (gram, page)) WITHOUT ROWID')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                             [('version', str(INDEX_VERSION)), ('source_hash', source_hash)])
+        return conn
+
+    def build(self, page_callback=None):
+        """Add every page that isn't in the index yet."""
+        import fitz
+        conn = self.open_index(file_hash(self.pdf_path))
+        self.opened.set()
+        doc = fitz.open(self.pdf_path)
+        try:
+            self.page_count = len(doc)
+            done = {page for page, in conn.execute('SELECT page FROM pages')}
+            self.indexed_pages = len(done)
+            for page_number in range(len(doc)):
+                if self._stop.is_set():
+                    return
+                if page_number in done:
+                    continue
+                if self._reopen.is_set():
+                    # Read the file as it is now rather than through a handle on what it was
+                    self._reopen.clear()
+                    doc.close()
+                    doc = fitz.open(self.pdf_path)
+                self.add_page(conn, page_number, PageTextLayout(doc.load_page(page_number)))
+                self.indexed_pages += 1
+                if page_callback:
+                    page_callback(page_number)
+        finally:
+            doc.close()
+            conn.close()
+
+    def add_page(self, conn, page_number, layout):
+        """Store a page's text and character boxes and index its n-grams."""
+        text = ''.join(char[4] for char in layout.chars)
+        boxes = array('f', [value for char in layout.chars for value in char[:4]])
+        line_starts = array('i', layout.line_starts)
+        with conn:
+            conn.execute('INSERT INTO pages VALUES (?, ?, ?, ?)',
+                         (page_number, text, boxes.tobytes(), line_starts.tobytes()))
+            conn.executemany('INSERT INTO grams VALUES (?, ?)',
+                             [(gram, page_number) for gram in page_grams(text)])
+
+    def source_changed(self):
+        """Note that the PDF changed on disk without its text changing, in a background thread.
+
+        The index is tied to the file as it is now, so it still holds the next
+        time the PDF is opened.
+        """
+        self._reopen.set()
+        threading.Thread(target=self.update_source_hash, name='Search index hash', daemon=True).start()
+
+    def update_source_hash(self):
+        """Tie the index to the PDF as it is now, after a change that left its text alone.
+
+        Does nothing if there is no index yet; whoever creates it hashes the file then.
+        """
+        if self._thread is not None:
+            # The indexer opens the index with the hash the file had before, so wait for it
+            while not self.opened.wait(0.1):
+                if self.ready.is_set():
+                    break
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            conn = sqlite3.connect(self.index_file)
+            try:
+                with conn:
+                    conn.execute('REPLACE INTO meta VALUES (?, ?)', ('source_hash', file_hash(self.pdf_path)))
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            pass  # The index is built again the next time the PDF is opened
+
+    # Searching
+
+    def indexed_page_numbers(self):
+        """Get the numbers of the pages indexed so far."""
+        if not self.opened.is_set():
+            return set()
+        return {page for page, in self.connection().execute('SELECT page FROM pages')}
+
+    def search(self, query):
+        """Find a query in the pages indexed so far, returning (page, rects, snippet) hits in page order."""
+        query = query.strip()
+        if not query or not self.opened.is_set():
+            return []
+        grams = query_grams(query)
+        placeholders = ', '.join('?' * len(grams))
+        pages = self.connection().execute(
+            f'SELECT page FROM grams WHERE gram IN ({placeholders}) '
+            'GROUP BY page HAVING COUNT(*) = ? ORDER BY page', grams + [len(grams)])
+        hits = []
+        for page_number, in pages.fetchall():
+            hits.extend(self.search_page(page_number, query))
+        return hits
+
+    def search_page(self, page_number, query):
+        """Find a query on one indexed page, returning (page, rects, snippet) hits."""
+        query = query.strip()
+        if not query or not self.opened.is_set():
+            return []
+        row = self.connection().execute(
+            'SELECT text, boxes, line_starts FROM pages WHERE page = ?', (page_number,)).fetchone()
+        if row is None:
+            return []
+        text, boxes, line_starts = row[0], array('f'), array('i')
+        boxes.frombytes(row[1])
+        line_starts.frombytes(row[2])
+
+        hits = []
+        start = text.find(query)
+        while start != -1:
+            end = start + len(query)
+            snippet = text[max(0, start - SNIPPET_CONTEXT):end + SNIPPET_CONTEXT]
+            hits.append((page_number, self.hit_rects(boxes, line_starts, start, end), snippet))
+            start = text.find(query, end)
+        return hits
+
+    def hit_rects(self, boxes, line_starts, start, end):
+        """Merge the boxes of the characters from start to end into one rectangle per line."""
+        rects = []
+        last_line = None
+        for index in range(start, end):
+            x0, y0, x1, y1 = boxes[index * 4:index * 4 + 4]
+            line = bisect_right(line_starts, index)
+            if line != last_line:
+                rects.append([x0, y0, x1, y1])
+                last_line = line
+            else:
+                rect = rects[-1]
+                rect[0], rect[1] = min(rect[0], x0), min(rect[1], y0)
+                rect[2], rect[3] = max(rect[2], x1), max(rect[3], y1)
+        return [tuple(rect) for rect in rects]
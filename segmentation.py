@@ -0,0 +1,27 @@
+import re
+
+# Anything that can't be part of a Japanese word: not kana and not in the common kanji block
+NON_WORD_CHARS = re.compile(r'[^\u3040-\u30FF\u4E00-\u9FAF]+')
+
+
+def clean_word(word):
+    """Clean and normalize the extracted word for Japanese word lookup."""
+    return NON_WORD_CHARS.sub('', word)
+
+
+def split_into_possible_words(dictionary, text, longest=False):
+    """Split the text into individual words, giving inflected words in their dictionary form."""
+    words = [word for _, _, word in dictionary.find_words(text, longest)]
+    return list(dict.fromkeys(words))
+
+
+def tokenize(dictionary, text):
+    """Split running text into dictionary words, longest match first, in the order they appear.
+
+    Punctuation, spaces and line breaks separate runs that are segmented on
+    their own, so no word is matched across the end of a sentence.
+    """
+    for run in NON_WORD_CHARS.split(text):
+        if run:
+            for _, _, word in dictionary.find_words(run, longest=True):
+                yield word
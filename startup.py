@@ -0,0 +1,37 @@
+import sys
+import time
+
+from PyQt5.QtCore import QObject, QEvent
+
+# The window should have painted within this long of main.py starting
+FIRST_PAINT_TARGET_MS = 300
+
+
+class StartupTimer(QObject):
+    """Reports how long startup takes to reach each milestone, on stderr."""
+
+    def __init__(self, started):
+        super().__init__()
+        self.started = started  # perf_counter() when main.py started
+        self.milestones = {}
+
+    def milestone(self, name):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.milestones[name] = elapsed
+        print(f"{name:24} {elapsed:8.1f} ms", file=sys.stderr)
+
+    def watch(self, widget):
+        """Record the first time a widget paints."""
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and 'window painted' not in self.milestones:
+            self.milestone('window painted')
+            obj.removeEventFilter(self)
+        return False
+
+    def finish(self):
+        painted = self.milestones.get('window painted')
+        if painted is not None:
+            verdict = "within" if painted <= FIRST_PAINT_TARGET_MS else "over"
+            print(f"First paint {verdict} the {FIRST_PAINT_TARGET_MS} ms target", file=sys.stderr)
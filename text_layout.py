@@ -0,0 +1,106 @@
+from bisect import bisect_right
+
+# Side of a grid cell, in PDF points
+CELL_SIZE = 24
+
+
+class PageTextLayout:
+    """The characters of a page and their boxes, bucketed in a grid for fast hit-testing.
+
+    Built once per page from get_text("rawdict"); after that, clip and
+    point queries only look at the few grid cells they touch instead of
+    extracting the page's text again.
+    """
+
+    def __init__(self, page):
+        self.chars = []  # (x0, y0, x1, y1, character) in reading order
+        self.line_starts = []  # Index of the first character of each line
+        self.grid = {}
+
+        for block in page.get_text("rawdict")["blocks"]:
+            for line in block.get("lines", ()):
+                self.line_starts.append(len(self.chars))
+                for span in line["spans"]:
+                    for char in span["chars"]:
+                        x0, y0, x1, y1 = char["bbox"]
+                        self.add_char(x0, y0, x1, y1, char["c"])
+
+    def __len__(self):
+        return len(self.chars)
+
+    def add_char(self, x0, y0, x1, y1, c):
+        """Add a character and register it in every grid cell its box touches."""
+        index = len(self.chars)
+        self.chars.append((x0, y0, x1, y1, c))
+        for cell in self.cells(x0, y0, x1, y1):
+            self.grid.setdefault(cell, []).append(index)
+
+    def cells(self, x0, y0, x1, y1):
+        """Get the grid cells a rectangle touches."""
+        return [(column, row)
+                for column in range(int(x0 // CELL_SIZE), int(x1 // CELL_SIZE) + 1)
+                for row in range(int(y0 // CELL_SIZE), int(y1 // CELL_SIZE) + 1)]
+
+    def chars_in_rect(self, x0, y0, x1, y1):
+        """Get the indices, in reading order, of the characters whose boxes overlap a rectangle."""
+        found = set()
+        for cell in self.cells(x0, y0, x1, y1):
+            for index in self.grid.get(cell, ()):
+                cx0, cy0, cx1, cy1, _ = self.chars[index]
+                if cx0 < x1 and cx1 > x0 and cy0 < y1 and cy1 > y0:
+                    found.add(index)
+        return sorted(found)
+
+    def text_in_rect(self, x0, y0, x1, y1):
+        """Get the text inside a rectangle, one line per line of the page like get_text("text", clip=...)."""
+        lines = []
+        last_line = None
+        for index in self.chars_in_rect(x0, y0, x1, y1):
+            line = self.line_of(index)
+            if line != last_line:
+                lines.append([])
+                last_line = line
+            lines[-1].append(self.chars[index][4])
+        return ''.join(''.join(line) + '\n' for line in lines)
+
+    def char_at(self, x, y):
+        """Get the index of the character under a point, or None."""
+        for index in self.grid.get((int(x // CELL_SIZE), int(y // CELL_SIZE)), ()):
+            cx0, cy0, cx1, cy1, _ = self.chars[index]
+            if cx0 <= x < cx1 and cy0 <= y < cy1:
+                return index
+        return None
+
+    def line_of(self, index):
+        """Get the number of the line a character is on."""
+        return bisect_right(self.line_starts, index) - 1
+
+    def line_text(self, line):
+        """Get the text of a line and the index of its first character."""
+        start = self.line_starts[line]
+        end = self.line_starts[line + 1] if line + 1 < len(self.line_starts) else len(self.chars)
+        return ''.join(char[4] for char in self.chars[start:end]), start
+
+    def text_from(self, index, length):
+        """Get up to length characters of running text starting at a character, across line breaks."""
+        return ''.join(char[4] for char in self.chars[index:index + length])
+
+    def span_rects(self, start, end):
+        """Get one rectangle per line covering the characters from start to end."""
+        rects = []
+        last_line = None
+        for index in range(start, min(end, len(self.chars))):
+            x0, y0, x1, y1, _ = self.chars[index]
+            line = self.line_of(index)
+            if line != last_line:
+                rects.append([x0, y0, x1, y1])
+                last_line = line
+            else:
+                rect = rects[-1]
+                rect[0], rect[1] = min(rect[0], x0), min(rect[1], y0)
+                rect[2], rect[3] = max(rect[2], x1), max(rect[3], y1)
+        return [tuple(rect) for rect in rects]
+
+    def byte_size(self):
+        """Roughly how much memory the layout takes, for cache budgeting."""
+        return 200 * len(self.chars) + 64 * len(self.grid)
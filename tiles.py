@@ -0,0 +1,32 @@
+# Side of a square tile, in pixels
+TILE_SIZE = 512
+# Pages whose full render would take more than this are drawn in tiles instead
+TILED_PAGE_BYTES = 24 * 1024 * 1024
+
+
+def page_pixel_size(rect, scale):
+    """Get the size in pixels of a page rendered at a scale."""
+    return int(rect.width * scale), int(rect.height * scale)
+
+
+def needs_tiles(rect, scale):
+    """Check whether a page is too big at this scale to render in one piece."""
+    width, height = page_pixel_size(rect, scale)
+    return width * height * 4 > TILED_PAGE_BYTES
+
+
+def tiles_in_rect(x, y, width, height, page_width, page_height):
+    """Get the (column, row) of every tile that overlaps a rectangle of the page."""
+    first_column = max(0, x // TILE_SIZE)
+    first_row = max(0, y // TILE_SIZE)
+    last_column = min((page_width - 1) // TILE_SIZE, (x + width - 1) // TILE_SIZE)
+    last_row = min((page_height - 1) // TILE_SIZE, (y + height - 1) // TILE_SIZE)
+    return [(column, row)
+            for row in range(first_row, last_row + 1)
+            for column in range(first_column, last_column + 1)]
+
+
+def tile_clip(column, row, scale):
+    """Get the area of the page a tile covers, in PDF coordinates."""
+    return (column * TILE_SIZE / scale, row * TILE_SIZE / scale,
+            (column + 1) * TILE_SIZE / scale, (row + 1) * TILE_SIZE / scale)
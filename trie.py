@@ -0,0 +1,67 @@
+from bisect import bisect_left
+
+# Sorts after any character that can follow a prefix, used to find the end of a prefix's range
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class WordTrie:
+    """Prefix trie over a sorted array of words.
+
+    A node is the range of words that share a prefix, so stepping down one
+    character is a binary search inside the parent's range. That keeps the
+    whole thing as a single list of strings instead of hundreds of thousands
+    of node objects.
+    """
+
+    def __init__(self, words):
+        self.words = sorted(set(word for word in words if word))
+        self.max_length = max(map(len, self.words), default=0)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        i = bisect_left(self.words, word)
+        return i < len(self.words) and self.words[i] == word
+
+    def prefix_ends(self, text, start=0):
+        """Yield the end offset of every word in the trie that starts at text[start]."""
+        words = self.words
+        lo, hi = 0, len(words)
+        limit = min(len(text), start + self.max_length)
+        for end in range(start + 1, limit + 1):
+            prefix = text[start:end]
+            lo = bisect_left(words, prefix, lo, hi)
+            if lo == hi or not words[lo].startswith(prefix):
+                return
+            hi = bisect_left(words, prefix + _MAX_CHAR, lo, hi)
+            if words[lo] == prefix:
+                yield end
+
+    def longest_match(self, text, start=0):
+        """Get the end offset of the longest word starting at text[start], or None."""
+        longest = None
+        for end in self.prefix_ends(text, start):
+            longest = end
+        return longest
+
+    def find_all(self, text):
+        """Find every word in the text as (start, end, word), ordered by start then length."""
+        matches = []
+        for start in range(len(text)):
+            for end in self.prefix_ends(text, start):
+                matches.append((start, end, text[start:end]))
+        return matches
+
+    def find_longest(self, text):
+        """Split the text into the longest words from left to right, skipping unknown characters."""
+        matches = []
+        start = 0
+        while start < len(text):
+            end = self.longest_match(text, start)
+            if end is None:
+                start += 1
+                continue
+            matches.append((start, end, text[start:end]))
+            start = end
+        return matches